@@ -1437,12 +1437,14 @@ class ManualReviewPage(ttk.Frame):
             for col in ("CÓDIGO_SNIES_DEL_PROGRAMA", "NOMBRE_DEL_PROGRAMA", "NOMBRE_INSTITUCIÓN"):
                 if col not in df.columns:
                     df[col] = ""
-            mask = (
-                df["CÓDIGO_SNIES_DEL_PROGRAMA"].astype(str).str.lower().str.contains(q, na=False)
-                | df["NOMBRE_DEL_PROGRAMA"].astype(str).str.lower().str.contains(q, na=False)
-                | df["NOMBRE_INSTITUCIÓN"].astype(str).str.lower().str.contains(q, na=False)
-            )
-            df = df[mask]
+            # Una sola columna de búsqueda en minúsculas (separador \x1f para que la consulta no
+            # coincida a caballo entre dos columnas) y una sola búsqueda literal, sin regex
+            texto = (
+                df["CÓDIGO_SNIES_DEL_PROGRAMA"].astype(str)
+                + "\x1f" + df["NOMBRE_DEL_PROGRAMA"].astype(str)
+                + "\x1f" + df["NOMBRE_INSTITUCIÓN"].astype(str)
+            ).str.lower()
+            df = df[texto.str.contains(q, na=False, regex=False)]
 
         # asegurar columnas
         for c in self.display_columns:
@@ -2535,7 +2537,11 @@ class MergePage(ttk.Frame):
         if not current_path.exists():
             messagebox.showerror("Error", f"No existe: {current_path}", parent=self)
             return
-        if not hist_path.exists():
+        # El histórico de programas nuevos por defecto vive en Parquet (el .xlsx es una
+        # exportación opcional que puede faltar o estar desactualizada): se lee con leer_historico
+        from etl.historicoProgramasNuevos import existe_historico, leer_historico
+        es_historico_canonico = hist_path.resolve() == self.default_hist.resolve()
+        if not (existe_historico() if es_historico_canonico else hist_path.exists()):
             messagebox.showerror("Error", f"No existe: {hist_path}", parent=self)
             return
 
@@ -2548,10 +2554,13 @@ class MergePage(ttk.Frame):
         try:
             # histórico de programas nuevos suele tener hoja ProgramasNuevos
             from etl.exceptions_helpers import leer_excel_con_reintentos
-            try:
-                df_hist = leer_excel_con_reintentos(hist_path, sheet_name="ProgramasNuevos")
-            except Exception:
-                df_hist = leer_excel_con_reintentos(hist_path)
+            if es_historico_canonico:
+                df_hist = leer_historico()
+            else:
+                try:
+                    df_hist = leer_excel_con_reintentos(hist_path, sheet_name="ProgramasNuevos")
+                except Exception:
+                    df_hist = leer_excel_con_reintentos(hist_path)
         except Exception as exc:
             messagebox.showerror("Error", f"No se pudo leer el histórico: {exc}", parent=self)
             return
@@ -5020,6 +5029,16 @@ class MainMenuGUI:
             safe_messagebox_error("Error", "Configura primero la carpeta del proyecto.", parent=self.root)
             return
         log_path = base / "logs" / "pipeline.log"
+        from etl.pipeline_logger import vaciar_log
+        try:
+            vaciar_log()
+        except Exception as exc:
+            # El log se abre igual, pero puede no incluir los últimos mensajes
+            safe_messagebox_error(
+                "Atención",
+                f"No se pudieron escribir en disco los últimos mensajes del log:\n{exc}",
+                parent=self.root,
+            )
         if not log_path.exists():
             safe_messagebox_error("Atención", f"No existe el log aún:\n{log_path}", parent=self.root)
             return
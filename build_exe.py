@@ -241,11 +241,11 @@ def crear_spec_file(modo_onefile: bool = False) -> Path:
         # Data processing
         'pandas', 'numpy', 'pandas._libs.tslibs.timedeltas',
         'pandas._libs.tslibs.nattype', 'pandas._libs.tslibs.np_datetime',
-        'pandas._libs.tslibs.tzconversion',
+        'pandas._libs.tslibs.tzconversion', 'pyarrow', 'pyarrow.parquet',
         
         # Excel
         'openpyxl', 'openpyxl.cell._writer', 'openpyxl.workbook',
-        'openpyxl.worksheet', 'openpyxl.styles',
+        'openpyxl.worksheet', 'openpyxl.styles', 'python_calamine',
         
         # ML
         'sklearn', 'sklearn.ensemble', 'sklearn.ensemble._forest',
@@ -276,7 +276,7 @@ def crear_spec_file(modo_onefile: bool = False) -> Path:
         'etl', 'etl.config', 'etl.descargaSNIES', 'etl.normalizacion',
         'etl.normalizacion_final', 'etl.procesamientoSNIES',
         'etl.clasificacionProgramas', 'etl.historicoProgramasNuevos',
-        'etl.pipeline_logger', 'etl.exceptions_helpers',
+        'etl.pipeline_logger', 'etl.exceptions_helpers', 'etl.excel_io',
     ]
     
     hidden_imports_str = ",\n        ".join([f"'{imp}'" for imp in hidden_imports])
@@ -107,13 +107,12 @@ try:
         print(f"  [ADVERTENCIA] ARCHIVO_HISTORICO tiene nombre diferente: {ARCHIVO_HISTORICO.name}")
         print(f"    Esperado: {nombre_esperado}")
     
-    # Verificar si existe el archivo histórico
-    if ARCHIVO_HISTORICO.exists():
+    # Verificar si existe el archivo histórico (Parquet canónico o exportación .xlsx)
+    from etl.historicoProgramasNuevos import existe_historico, leer_historico
+    if existe_historico():
         print(f"  [OK] Archivo histórico existe: {ARCHIVO_HISTORICO}")
         try:
-            from etl.config import HOJA_HISTORICO
-            import pandas as pd
-            df = pd.read_excel(ARCHIVO_HISTORICO, sheet_name=HOJA_HISTORICO)
+            df = leer_historico()
             print(f"  [OK] Archivo histórico es válido: {len(df)} registros")
         except Exception as e:
             print(f"  [ERROR] Error leyendo archivo histórico: {e}")
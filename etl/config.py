@@ -222,6 +222,8 @@ LOGS_DIR.mkdir(parents=True, exist_ok=True)
 # ========= RUTAS DE ARCHIVOS =========
 ARCHIVO_PROGRAMAS = OUTPUTS_DIR / "Programas.xlsx"
 ARCHIVO_HISTORICO = OUTPUTS_DIR / "HistoricoProgramasNuevos.xlsx"
+# Copia canónica del histórico en Parquet (el .xlsx queda como exportación)
+ARCHIVO_HISTORICO_PARQUET = ARCHIVO_HISTORICO.with_suffix(".parquet")
 
 # ========= PIPELINE MERCADO (Fase 1+) =========
 TEMP_DIR = _get_temp_dir_local(_BASE_PATH)
@@ -479,6 +481,10 @@ except (TypeError, ValueError):
 
 # Limpieza de históricos: umbral configurable
 MAX_ARCHIVOS_HISTORICOS = max(5, int(_CONFIG.get("max_archivos_historicos", 20)))
+# Histórico de programas nuevos: además del Parquet canónico, exportar el .xlsx en cada ejecución
+HISTORICO_EXPORTAR_XLSX = bool(_CONFIG.get("historico_exportar_xlsx", True))
+# Imputación de áreas en CPU: usar el backend ONNX Runtime de sentence-transformers si está instalado
+EMBEDDINGS_BACKEND_ONNX = bool(_CONFIG.get("embeddings_backend_onnx", False))
 
 # ========= CONFIGURACIÓN DE HOJAS =========
 HOJA_PROGRAMAS = "Programas"
@@ -496,7 +502,7 @@ def update_paths_for_base_dir(base_dir: Path) -> None:
         base_dir: Nuevo directorio base a usar
     """
     global _BASE_PATH, OUTPUTS_DIR, HISTORIC_DIR, REF_DIR, MODELS_DIR, DOCS_DIR, LOGS_DIR
-    global ARCHIVO_PROGRAMAS, ARCHIVO_HISTORICO, ARCHIVO_REFERENTES, ARCHIVO_CATALOGO_EAFIT, ARCHIVO_NORMALIZACION
+    global ARCHIVO_PROGRAMAS, ARCHIVO_HISTORICO, ARCHIVO_HISTORICO_PARQUET, ARCHIVO_REFERENTES, ARCHIVO_CATALOGO_EAFIT, ARCHIVO_NORMALIZACION
     global TEMP_DIR, ESTUDIO_MERCADO_DIR, HISTORICO_ESTUDIO_MERCADO_DIR
     global RAW_HISTORIC_DIR, CHECKPOINT_BASE_MAESTRA, MODELO_CLASIFICADOR_MERCADO, ARCHIVO_REFERENTE_CATEGORIAS, ARCHIVO_ESTUDIO_MERCADO
 
@@ -522,6 +528,7 @@ def update_paths_for_base_dir(base_dir: Path) -> None:
     # Recalcular rutas de archivos
     ARCHIVO_PROGRAMAS = OUTPUTS_DIR / "Programas.xlsx"
     ARCHIVO_HISTORICO = OUTPUTS_DIR / "HistoricoProgramasNuevos.xlsx"
+    ARCHIVO_HISTORICO_PARQUET = ARCHIVO_HISTORICO.with_suffix(".parquet")
     ARCHIVO_NORMALIZACION = DOCS_DIR / "normalizacionFinal.xlsx"
     TEMP_DIR = _get_temp_dir_local(base_dir)
     TEMP_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,176 @@
+"""
+Lectura y escritura de Excel en modo streaming (openpyxl read_only / write_only).
+
+Pensado para archivos que crecen con cada ejecución (p. ej. el histórico de programas
+nuevos), donde construir todas las celdas en memoria con pd.read_excel / to_excel es
+el costo dominante.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+
+def leer_excel_streaming(archivo: Path, sheet_name: str | int = 0) -> pd.DataFrame:
+    """
+    Lee una hoja de Excel recorriendo las filas en modo read_only (parseo SAX).
+
+    La primera fila se toma como encabezado. Igual que pd.read_excel, se descartan las filas
+    vacías del final y las columnas sin encabezado se nombran "Unnamed: N".
+
+    Args:
+        archivo: Ruta al archivo Excel
+        sheet_name: Nombre de la hoja o índice (0 = primera hoja)
+
+    Returns:
+        DataFrame con los datos de la hoja
+    """
+    wb = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        filas = ws.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return pd.DataFrame()
+        registros = list(filas)
+    finally:
+        wb.close()
+
+    # Quitar filas vacías al final de la hoja (formato residual), como hace pd.read_excel
+    while registros and all(valor is None for valor in registros[-1]):
+        registros.pop()
+
+    # Si la hoja no declara su dimensión (p. ej. escrita en modo write_only), openpyxl
+    # entrega cada fila solo hasta su última celda con valor: se rellenan a un ancho común.
+    ancho = max([len(encabezado)] + [len(fila) for fila in registros])
+    # Descartar columnas finales sin encabezado ni datos (dimensión de hoja "inflada")
+    while ancho > 0 and (ancho > len(encabezado) or encabezado[ancho - 1] is None) and all(
+        len(fila) < ancho or fila[ancho - 1] is None for fila in registros
+    ):
+        ancho -= 1
+    encabezado = tuple(encabezado[:ancho]) + (None,) * (ancho - len(encabezado))
+    if any(len(fila) != ancho for fila in registros):
+        registros = [fila[:ancho] + (None,) * (ancho - len(fila)) for fila in registros]
+
+    columnas = [
+        f"Unnamed: {i}" if col is None else col
+        for i, col in enumerate(encabezado)
+    ]
+    return pd.DataFrame.from_records(registros, columns=columnas)
+
+
+def leer_columna_streaming(archivo: Path, sheet_name: str, columna: str) -> pd.DataFrame:
+    """
+    Lee una sola columna de una hoja en modo read_only, sin convertir las demás celdas.
+
+    Útil cuando de un archivo grande solo se necesita una columna (p. ej. los códigos del
+    histórico) y no está calamine: pd.read_excel con openpyxl convierte todas las celdas
+    aunque se indique usecols.
+
+    Args:
+        archivo: Ruta al archivo Excel
+        sheet_name: Nombre de la hoja
+        columna: Encabezado de la columna a leer
+
+    Returns:
+        DataFrame con esa única columna, o un DataFrame vacío si la hoja no la tiene
+    """
+    wb = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name]
+        encabezado = next(ws.iter_rows(max_row=1, values_only=True), ())
+        if columna not in encabezado:
+            return pd.DataFrame()
+        indice = encabezado.index(columna) + 1
+        valores = [
+            fila[0] if fila else None
+            for fila in ws.iter_rows(min_row=2, min_col=indice, max_col=indice, values_only=True)
+        ]
+    finally:
+        wb.close()
+    return pd.DataFrame({columna: valores})
+
+
+def escribir_excel_streaming(archivo: Path, df: pd.DataFrame, sheet_name: str) -> None:
+    """
+    Escribe un DataFrame fila por fila con openpyxl en modo write_only.
+
+    A diferencia de to_excel, no construye la matriz de celdas completa en memoria: cada
+    fila se serializa al vuelo. El archivo se reemplaza con una única hoja; los nulos
+    (NaN/None/NA) se escriben como celdas vacías, igual que to_excel.
+
+    Args:
+        archivo: Ruta al archivo Excel a escribir
+        df: DataFrame a escribir (sin índice)
+        sheet_name: Nombre de la hoja
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append([str(col) for col in df.columns])
+    for fila in _filas_para_openpyxl(df):
+        ws.append(fila)
+    wb.save(archivo)
+
+
+def reemplazar_hoja_excel(archivo: Path, df: pd.DataFrame, sheet_name: str) -> None:
+    """
+    Escribe df en la hoja sheet_name conservando las demás hojas del archivo.
+
+    Si el archivo no existe o solo contiene esa hoja (caso de Programas.xlsx), se escribe en
+    modo write_only sin cargar el libro anterior. Si tiene otras hojas, se reemplaza solo
+    esa hoja con pd.ExcelWriter(mode="a"), que necesita el libro completo en memoria.
+
+    Args:
+        archivo: Ruta al archivo Excel
+        df: DataFrame a escribir (sin índice)
+        sheet_name: Nombre de la hoja a reemplazar
+    """
+    if archivo.exists():
+        wb = load_workbook(archivo, read_only=True)
+        try:
+            otras_hojas = [hoja for hoja in wb.sheetnames if hoja != sheet_name]
+        finally:
+            wb.close()
+        if otras_hojas:
+            with pd.ExcelWriter(archivo, mode="a", if_sheet_exists="replace", engine="openpyxl") as writer:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+            return
+    escribir_excel_streaming(archivo, df, sheet_name)
+
+
+def anexar_filas_excel(archivo: Path, df: pd.DataFrame, sheet_name: str) -> None:
+    """
+    Agrega las filas de df al final de una hoja existente.
+
+    Las filas previas no pasan por pandas: openpyxl las conserva tal cual y solo se
+    convierten las nuevas. Las columnas de df se ordenan según el encabezado de la hoja.
+
+    Args:
+        archivo: Ruta al archivo Excel existente
+        df: Filas a agregar (mismas columnas que el encabezado de la hoja)
+        sheet_name: Nombre de la hoja
+
+    Raises:
+        ValueError: Si el encabezado de la hoja no tiene exactamente las columnas de df
+    """
+    wb = load_workbook(archivo)
+    ws = wb[sheet_name]
+    encabezado = [celda.value for celda in ws[1]]
+    while encabezado and encabezado[-1] is None:
+        encabezado.pop()
+    if len(encabezado) != len(df.columns) or set(encabezado) != set(df.columns):
+        raise ValueError(
+            f"El encabezado de la hoja '{sheet_name}' en {archivo.name} no coincide con las columnas a anexar."
+        )
+    for fila in _filas_para_openpyxl(df[encabezado]):
+        ws.append(fila)
+    wb.save(archivo)
+
+
+def _filas_para_openpyxl(df: pd.DataFrame):
+    """Itera las filas de df como tuplas, con nulos (NaN/None/NA) convertidos a None (celda vacía)."""
+    valores = df.astype(object).where(df.notna(), None)
+    return valores.itertuples(index=False, name=None)
@@ -16,14 +16,36 @@ from openpyxl import load_workbook
 from openpyxl.utils.exceptions import InvalidFileException
 from zipfile import BadZipFile
 
+from etl.excel_io import leer_excel_streaming, reemplazar_hoja_excel
 from etl.pipeline_logger import log_error, log_warning
 
 
+def _motor_lectura_excel() -> str | None:
+    """
+    Motor rápido para pd.read_excel: "calamine" (lector en Rust, varias veces más rápido que
+    openpyxl) si python-calamine está instalado y pandas lo soporta (>= 2.2), o None.
+
+    No es el motor por defecto de leer_excel_con_reintentos: calamine infiere fechas y números
+    distinto que openpyxl (p. ej. códigos como float en vez de int). Solo lo piden las lecturas
+    pesadas cuyo resultado no depende de esos tipos (engine=MOTOR_LECTURA_EXCEL).
+    """
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    version_pandas = tuple(int(parte) for parte in pd.__version__.split(".")[:2])
+    return "calamine" if version_pandas >= (2, 2) else None
+
+
+MOTOR_LECTURA_EXCEL = _motor_lectura_excel()
+
+
 def leer_excel_con_reintentos(
     archivo: Path,
     sheet_name: str = "Programas",
     max_intentos: int = 3,
     delay_segundos: float = 2.0,
+    streaming: bool = False,
     **kwargs
 ) -> pd.DataFrame:
     """
@@ -39,7 +61,9 @@ def leer_excel_con_reintentos(
         sheet_name: Nombre de la hoja a leer
         max_intentos: Número máximo de reintentos si hay PermissionError
         delay_segundos: Segundos de espera entre reintentos
-        **kwargs: Argumentos adicionales para pd.read_excel
+        streaming: Si True, lee con openpyxl en modo read_only fila por fila
+            (etl.excel_io.leer_excel_streaming); ignora **kwargs
+        **kwargs: Argumentos adicionales para pd.read_excel (engine=None usa openpyxl)
         
     Returns:
         DataFrame con los datos
@@ -59,7 +83,10 @@ def leer_excel_con_reintentos(
     ultimo_error: Exception | None = None
     for intento in range(1, max_intentos + 1):
         try:
-            df = pd.read_excel(archivo, sheet_name=sheet_name, **kwargs)
+            if streaming:
+                df = leer_excel_streaming(archivo, sheet_name=sheet_name)
+            else:
+                df = pd.read_excel(archivo, sheet_name=sheet_name, **kwargs)
             if intento > 1:
                 log_warning(f"Archivo {archivo.name} leído exitosamente en intento {intento}")
             return df
@@ -121,7 +148,8 @@ def escribir_excel_con_reintentos(
         sheet_name: Nombre de la hoja
         max_intentos: Número máximo de reintentos si hay PermissionError
         delay_segundos: Segundos de espera entre reintentos
-        **kwargs: Argumentos adicionales para pd.ExcelWriter
+        **kwargs: Argumentos adicionales para pd.ExcelWriter. Sin kwargs se usa
+            etl.excel_io.reemplazar_hoja_excel (modo write_only si el archivo solo tiene esa hoja)
         
     Raises:
         PermissionError: Si después de reintentos sigue bloqueado
@@ -130,14 +158,17 @@ def escribir_excel_con_reintentos(
     ultimo_error: Exception | None = None
     for intento in range(1, max_intentos + 1):
         try:
-            with pd.ExcelWriter(
-                archivo,
-                mode="a" if archivo.exists() else "w",
-                if_sheet_exists="replace",
-                engine="openpyxl",
-                **kwargs
-            ) as writer:
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
+            if kwargs:
+                with pd.ExcelWriter(
+                    archivo,
+                    mode="a" if archivo.exists() else "w",
+                    if_sheet_exists="replace",
+                    engine="openpyxl",
+                    **kwargs
+                ) as writer:
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+            else:
+                reemplazar_hoja_excel(archivo, df, sheet_name=sheet_name)
             if intento > 1:
                 log_warning(f"Archivo {archivo.name} escrito exitosamente en intento {intento}")
             return
@@ -8,20 +8,31 @@ al archivo HistoricoProgramasNuevos.xlsx con la fecha de ejecución.
 from __future__ import annotations
 
 import datetime
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
+from pandas.api.types import union_categoricals
 
 # Agregar el directorio raíz al path para importar módulos
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+from etl.excel_io import anexar_filas_excel
+from etl.exceptions_helpers import (
+    escribir_excel_con_reintentos,
+    explicar_error_archivo_abierto,
+    leer_excel_con_reintentos,
+)
 from etl.pipeline_logger import log_error, log_info, log_resultado, log_warning
 from etl.config import (
     ARCHIVO_PROGRAMAS,
     ARCHIVO_HISTORICO,
+    ARCHIVO_HISTORICO_PARQUET,
+    HISTORICO_EXPORTAR_XLSX,
     HOJA_PROGRAMAS,
     HOJA_HISTORICO,
 )
@@ -40,6 +51,29 @@ COLUMNAS_REQUERIDAS = [
     "ÁREA_DE_CONOCIMIENTO",  # Agregada para guardar área imputada
 ]
 
+# Variaciones legacy del nombre del histórico (migración desde nombres antiguos con espacio)
+NOMBRES_HISTORICO_LEGACY = (
+    "HistoricoProgramasNuevos .xlsx",
+    "HistoricoProgramasNuevos  .xlsx",
+)
+
+# Columnas de texto con pocos valores distintos: se manejan como category (menos memoria,
+# comparaciones sobre códigos enteros)
+COLUMNAS_CATEGORICAS = [
+    "NOMBRE_INSTITUCIÓN",
+    "PROGRAMA_NUEVO",
+    "ES_REFERENTE",
+    "PROGRAMA_EAFIT_NOMBRE",
+]
+
+# Columnas de códigos enteros que se reducen al tipo sin signo más pequeño (uint16/uint32)
+COLUMNAS_CODIGOS = [
+    "CÓDIGO_INSTITUCIÓN_PADRE",
+    "CÓDIGO_INSTITUCIÓN",
+    "CÓDIGO_SNIES_DEL_PROGRAMA",
+    "PROGRAMA_EAFIT_CODIGO",
+]
+
 # Nombre de la columna de fecha (primera columna)
 COLUMNA_FECHA = "FECHA"
 
@@ -86,45 +120,303 @@ def _limpiar_archivos_temporales_excel(directorio: Path) -> None:
             log_warning(f"No se pudo eliminar archivo temporal {os.path.basename(archivo_temp)}: {e}")
 
 
+def _reducir_codigos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduce (in place) las columnas de COLUMNAS_CODIGOS al entero sin signo más pequeño.
+    
+    Solo se tocan columnas ya enteras (sin nulos ni texto): convertir las demás con
+    errors="coerce" perdería códigos no numéricos.
+    """
+    for col in COLUMNAS_CODIGOS:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = pd.to_numeric(df[col], downcast="unsigned")
+    return df
+
+
+def existe_historico() -> bool:
+    """Indica si hay histórico guardado (Parquet canónico o .xlsx)."""
+    return ARCHIVO_HISTORICO_PARQUET.exists() or ARCHIVO_HISTORICO.exists()
+
+
+def _parquet_historico_vigente() -> bool:
+    """True si el Parquet existe y no es más antiguo que el .xlsx (que pudo editarse a mano)."""
+    if not ARCHIVO_HISTORICO_PARQUET.exists():
+        return False
+    if not ARCHIVO_HISTORICO.exists():
+        return True
+    return ARCHIVO_HISTORICO_PARQUET.stat().st_mtime >= ARCHIVO_HISTORICO.stat().st_mtime
+
+
+def leer_historico() -> pd.DataFrame:
+    """
+    Lee el histórico de programas nuevos.
+    
+    Usa el Parquet canónico cuando está al día. Si no existe (primera ejecución tras la
+    migración), no se puede leer, o el .xlsx es más reciente, lee el .xlsx.
+    """
+    
+    if _parquet_historico_vigente():
+        try:
+            return _reducir_codigos(pd.read_parquet(ARCHIVO_HISTORICO_PARQUET))
+        except Exception as e:
+            if not ARCHIVO_HISTORICO.exists():
+                raise
+            log_warning(f"No se pudo leer {ARCHIVO_HISTORICO_PARQUET.name}: {e}. Se usará el .xlsx.")
+    return _reducir_codigos(
+        leer_excel_con_reintentos(ARCHIVO_HISTORICO, sheet_name=HOJA_HISTORICO, streaming=True)
+    )
+
+
+def _preparar_para_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte a texto las columnas object con tipos mezclados (p. ej. códigos leídos de
+    Excel como int y str a la vez), que Parquet no puede almacenar en una sola columna.
+    """
+    mixtas = [
+        col for col in df.columns
+        if df[col].dtype == object
+        and pd.api.types.infer_dtype(df[col], skipna=True) in ("mixed", "mixed-integer")
+    ]
+    if not mixtas:
+        return df
+    df = df.copy()
+    for col in mixtas:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _serializar_parquet(df: pd.DataFrame) -> bytes:
+    """Serializa el histórico a Parquet en memoria (zstd: archivo más pequeño y lectura igual de rápida)."""
+    return _preparar_para_parquet(df).to_parquet(index=False, compression="zstd")
+
+
+def _escribir_parquet_historico(contenido_parquet: bytes) -> None:
+    """
+    Escribe el Parquet canónico de forma atómica (archivo temporal + os.replace).
+    
+    Es la única fuente del histórico: un cierre a mitad de escritura no debe dejarlo dañado.
+    """
+    ruta_tmp = ARCHIVO_HISTORICO_PARQUET.with_name(f"{ARCHIVO_HISTORICO_PARQUET.name}.tmp")
+    ruta_tmp.write_bytes(contenido_parquet)
+    os.replace(ruta_tmp, ARCHIVO_HISTORICO_PARQUET)
+
+
+def _escribir_historico_xlsx(df: pd.DataFrame) -> None:
+    """
+    Escribe la exportación .xlsx del histórico con reintentos si está abierta en Excel.
+    
+    Raises:
+        PermissionError: Si el archivo sigue bloqueado tras los reintentos (mensaje explicativo)
+    """
+    try:
+        escribir_excel_con_reintentos(ARCHIVO_HISTORICO, df, sheet_name=HOJA_HISTORICO)
+    except PermissionError as e:
+        error_msg = explicar_error_archivo_abierto(ARCHIVO_HISTORICO, "escribir")
+        log_error(error_msg)
+        raise PermissionError(error_msg) from e
+
+
+def guardar_historico(df: pd.DataFrame) -> None:
+    """
+    Guarda el histórico: Parquet canónico y, si HISTORICO_EXPORTAR_XLSX, la exportación .xlsx.
+    
+    El Parquet se escribe después del .xlsx para que quede como la versión vigente. Si no se
+    puede serializar a Parquet (p. ej. falta pyarrow), el .xlsx se escribe siempre.
+    """
+    ARCHIVO_HISTORICO.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        contenido_parquet = _serializar_parquet(df)
+    except Exception as e:
+        log_warning(f"No se pudo serializar el histórico a Parquet: {e}. Se guardará solo el .xlsx.")
+        contenido_parquet = None
+    
+    if HISTORICO_EXPORTAR_XLSX or contenido_parquet is None:
+        _escribir_historico_xlsx(df)
+    if contenido_parquet is not None:
+        _escribir_parquet_historico(contenido_parquet)
+
+
+def exportar_historico_xlsx() -> Path:
+    """
+    Genera bajo demanda HistoricoProgramasNuevos.xlsx a partir del Parquet canónico.
+    
+    Pensado para cuando historico_exportar_xlsx está desactivado y se necesita el Excel
+    (revisión manual, envío a terceros): la exportación se hace una vez, no en cada ejecución.
+    
+    Returns:
+        Ruta del .xlsx generado
+    
+    Raises:
+        FileNotFoundError: Si no hay histórico guardado
+    """
+    if not existe_historico():
+        raise FileNotFoundError(f"No existe el histórico de programas nuevos: {ARCHIVO_HISTORICO_PARQUET}")
+    df = leer_historico()
+    ARCHIVO_HISTORICO.parent.mkdir(parents=True, exist_ok=True)
+    _escribir_historico_xlsx(df)
+    # El .xlsx recién escrito es más nuevo que el Parquet: se re-sella el Parquet para que
+    # siga siendo la versión vigente (ambos tienen el mismo contenido)
+    if ARCHIVO_HISTORICO_PARQUET.exists():
+        os.utime(ARCHIVO_HISTORICO_PARQUET)
+    log_info(f"Histórico exportado a {ARCHIVO_HISTORICO.name} ({len(df)} registros)")
+    print(f"✓ Histórico exportado: {ARCHIVO_HISTORICO}")
+    return ARCHIVO_HISTORICO
+
+
+def _alinear_categorias(*dfs: pd.DataFrame) -> None:
+    """
+    Unifica (in place) las categorías de COLUMNAS_CATEGORICAS entre varios DataFrames.
+    
+    pd.concat solo conserva el dtype category si todas las partes tienen exactamente las
+    mismas categorías; de lo contrario degrada la columna a object.
+    """
+    for col in COLUMNAS_CATEGORICAS:
+        if not all(col in df.columns for df in dfs):
+            continue
+        series = [df[col].astype("category") for df in dfs]
+        # Las columnas totalmente vacías no aportan categorías (y su dtype puede ser float)
+        con_valores = [serie for serie in series if len(serie.cat.categories) > 0]
+        if not con_valores:
+            continue
+        try:
+            categorias = union_categoricals(con_valores, ignore_order=True).categories
+        except TypeError:
+            # Categorías de tipos distintos (p. ej. números y texto): se deja como está
+            continue
+        tipo = pd.CategoricalDtype(categorias)
+        for df in dfs:
+            df[col] = df[col].astype(tipo)
+
+
+def _anexar_historico(df_extraido: pd.DataFrame) -> int | None:
+    """
+    Agrega las filas nuevas al histórico sin reconstruirlo desde el .xlsx.
+    
+    Solo aplica si no hay archivos legacy duplicados, el Parquet está vigente, su esquema ya
+    tiene todas las columnas (no hace falta migrar) y, si se exporta el .xlsx, este existe con
+    el mismo encabezado. En el .xlsx solo se anexan las filas nuevas; el Parquet se reescribe
+    a partir de su propio contenido, que es columnar y barato de leer.
+    
+    Returns:
+        Total de registros del histórico tras anexar, o None si no aplica (usar el camino completo).
+    """
+    if any((ARCHIVO_HISTORICO.parent / nombre).exists() for nombre in NOMBRES_HISTORICO_LEGACY):
+        return None
+    if not _parquet_historico_vigente():
+        return None
+    if HISTORICO_EXPORTAR_XLSX and not ARCHIVO_HISTORICO.exists():
+        return None
+    
+    try:
+        df_existente = _reducir_codigos(pd.read_parquet(ARCHIVO_HISTORICO_PARQUET))
+    except Exception as e:
+        log_warning(f"No se pudo leer {ARCHIVO_HISTORICO_PARQUET.name} para anexar: {e}")
+        return None
+    columnas = list(df_existente.columns)
+    columnas_set = set(columnas)
+    if any(col not in columnas_set for col in [COLUMNA_FECHA] + COLUMNAS_REQUERIDAS):
+        return None
+    
+    df_nuevas = df_extraido.reindex(columns=columnas)
+    _alinear_categorias(df_existente, df_nuevas)
+    # Columnas ya alineadas (mismo orden y categorías): concat solo empalma bloques
+    df_total = pd.concat([df_existente, df_nuevas], ignore_index=True, sort=False, copy=False)
+    try:
+        contenido_parquet = _serializar_parquet(df_total)
+    except Exception as e:
+        log_warning(f"No se pudo serializar el histórico a Parquet: {e}")
+        return None
+    
+    if HISTORICO_EXPORTAR_XLSX:
+        try:
+            anexar_filas_excel(ARCHIVO_HISTORICO, df_nuevas, sheet_name=HOJA_HISTORICO)
+        except (KeyError, ValueError) as e:
+            # Hoja o encabezado distintos: se reconstruye el histórico completo
+            log_warning(f"No se pudo anexar a {ARCHIVO_HISTORICO.name}: {e}. Se reescribirá completo.")
+            return None
+        except PermissionError:
+            # Abierto en Excel: el camino completo escribe con reintentos y mensaje explicativo
+            log_warning(f"{ARCHIVO_HISTORICO.name} está abierto. Se reescribirá completo con reintentos.")
+            return None
+    _escribir_parquet_historico(contenido_parquet)
+    return len(df_total)
+
+
+def _clave_codigo_snies(serie: pd.Series) -> pd.Series:
+    """
+    Devuelve una clave uint64 por fila a partir del código SNIES normalizado.
+    
+    La normalización es la misma que se usaba al comparar strings (strip, mayúsculas,
+    sin sufijo ".0" y nulos como ""), pero se aplica con operaciones vectorizadas y el
+    resultado se reduce a un hash de 64 bits, más barato de comparar en merge/isin.
+    """
+    texto = (
+        serie.astype(str)
+        .str.strip()
+        .str.upper()
+        .str.replace(r"\.0$", "", regex=True)
+        .where(serie.notna(), "")
+    )
+    return pd.Series(pd.util.hash_array(texto.to_numpy(dtype=object)), index=serie.index)
+
+
 def _consolidar_archivos_historicos_duplicados() -> pd.DataFrame | None:
     """
     Consolida archivos históricos duplicados si existen múltiples variaciones del nombre.
     
     Busca variaciones del nombre (con/sin espacio) y consolida todos los registros.
-    Mantiene el archivo con más registros (ARCHIVO_HISTORICO) y elimina los que tienen menos.
+    El consolidado se guarda como histórico principal (Parquet y exportación .xlsx) y
+    después se eliminan las variaciones legacy.
     
     Returns:
         DataFrame consolidado con todos los registros, o None si no hay archivos históricos.
     """
-    from etl.exceptions_helpers import leer_excel_con_reintentos
     
     # Limpiar archivos temporales de Excel antes de procesar
     _limpiar_archivos_temporales_excel(ARCHIVO_HISTORICO.parent)
     
     archivos_encontrados = []
     # Buscar variaciones legacy (migración desde nombres antiguos con espacio)
-    variaciones = [
-        ARCHIVO_HISTORICO,
-        ARCHIVO_HISTORICO.parent / "HistoricoProgramasNuevos .xlsx",
-        ARCHIVO_HISTORICO.parent / "HistoricoProgramasNuevos  .xlsx",
+    variaciones = [ARCHIVO_HISTORICO] + [
+        ARCHIVO_HISTORICO.parent / nombre for nombre in NOMBRES_HISTORICO_LEGACY
     ]
     # Evitar intentar leer el mismo path dos veces si ya está en la lista
     variaciones = list(dict.fromkeys(variaciones))
     
-    # Buscar todos los archivos históricos posibles
-    for archivo in variaciones:
-        if archivo.exists():
-            # Ignorar archivos temporales de Excel
-            if archivo.name.startswith("~$"):
-                continue
-            try:
-                df = leer_excel_con_reintentos(archivo, sheet_name=HOJA_HISTORICO)
-                archivos_encontrados.append((archivo, df, len(df)))
-                print(f"Encontrado archivo histórico: {archivo.name} ({len(df)} registros)")
-                log_info(f"Archivo histórico encontrado: {archivo.name} ({len(df)} registros)")
-            except Exception as e:
-                print(f"[WARN] No se pudo leer {archivo.name}: {e}")
-                log_error(f"Error al leer {archivo.name}: {e}")
+    # Buscar todos los archivos históricos posibles (ignorando temporales de Excel).
+    # El principal cuenta como existente también si solo está su copia Parquet.
+    existentes = [
+        archivo for archivo in variaciones
+        if (archivo.exists() or (archivo == ARCHIVO_HISTORICO and existe_historico()))
+        and not archivo.name.startswith("~$")
+    ]
+    if not existentes:
+        return None
+    
+    def _leer(archivo: Path) -> pd.DataFrame | None:
+        try:
+            if archivo == ARCHIVO_HISTORICO:
+                return leer_historico()
+            return leer_excel_con_reintentos(archivo, sheet_name=HOJA_HISTORICO, streaming=True)
+        except Exception as e:
+            print(f"[WARN] No se pudo leer {archivo.name}: {e}")
+            log_error(f"Error al leer {archivo.name}: {e}")
+            return None
+    
+    # Caso habitual (un solo archivo): se lee directamente, sin pool de hilos.
+    # Con varias variaciones se leen en paralelo: el parseo de Excel es mayormente I/O + lxml.
+    if len(existentes) == 1:
+        leidos = [_leer(existentes[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(existentes)) as executor:
+            leidos = list(executor.map(_leer, existentes))
+    # Recoger en el orden original de las variaciones
+    for archivo, df in zip(existentes, leidos):
+        if df is None:
+            continue
+        archivos_encontrados.append((archivo, df, len(df)))
+        print(f"Encontrado archivo histórico: {archivo.name} ({len(df)} registros)")
+        log_info(f"Archivo histórico encontrado: {archivo.name} ({len(df)} registros)")
     
     if not archivos_encontrados:
         return None
@@ -183,12 +475,21 @@ def _consolidar_archivos_historicos_duplicados() -> pd.DataFrame | None:
     print(f"✓ Consolidación completada: {len(df_consolidado)} registros únicos")
     log_info(f"Consolidación completada: {len(df_consolidado)} registros únicos de {len(archivos_encontrados)} archivos")
     
-    # Eliminar los archivos con menos registros (mantener solo el principal)
-    # El archivo principal se escribirá después con todos los datos consolidados
+    # Guardar primero el consolidado como histórico principal (Parquet y, si corresponde, .xlsx):
+    # así el Parquet deja de ser una copia vieja y las variaciones se eliminan solo si quedó guardado
+    try:
+        guardar_historico(df_consolidado)
+    except Exception as e:
+        print(f"[WARN] No se pudo guardar el histórico consolidado: {e}")
+        log_error(f"Error al guardar el histórico consolidado: {e}. Se conservan los archivos duplicados.")
+        return df_consolidado
+    
+    # Eliminar las variaciones legacy (el principal ya contiene todos los registros)
     for archivo, _, registros in archivos_encontrados:
-        # Eliminar todos los archivos duplicados (el principal se reescribirá después)
+        if archivo == ARCHIVO_HISTORICO:
+            continue
         try:
-            archivo.unlink()
+            archivo.unlink(missing_ok=True)
             print(f"  → Eliminado archivo duplicado: {archivo.name} ({registros} registros)")
             log_info(f"Archivo duplicado eliminado: {archivo.name} ({registros} registros)")
         except Exception as e:
@@ -210,6 +511,10 @@ def actualizar_historico_programas_nuevos() -> None:
     - Mantiene el archivo con más registros (ARCHIVO_HISTORICO)
     - Elimina los archivos con menos registros
     """
+    # Fecha de ejecución: se fija una sola vez al inicio (si la ejecución cruza la medianoche,
+    # todos los registros quedan con la fecha en que empezó)
+    fecha_ejecucion = datetime.datetime.now().strftime("%Y-%m-%d")
+    
     # Limpiar archivos temporales de Excel antes de procesar
     _limpiar_archivos_temporales_excel(ARCHIVO_HISTORICO.parent)
     
@@ -222,8 +527,16 @@ def actualizar_historico_programas_nuevos() -> None:
     # Leer el archivo de programas usando función con reintentos
     print(f"Leyendo programas desde: {ARCHIVO_PROGRAMAS}")
     try:
-        from etl.exceptions_helpers import leer_excel_con_reintentos
-        df_programas = leer_excel_con_reintentos(ARCHIVO_PROGRAMAS, sheet_name=HOJA_PROGRAMAS)
+        # Solo se parsean las columnas que se guardan en el histórico (Programas.xlsx es ancho)
+        columnas_a_leer = set(COLUMNAS_REQUERIDAS)
+        df_programas = leer_excel_con_reintentos(
+            ARCHIVO_PROGRAMAS,
+            sheet_name=HOJA_PROGRAMAS,
+            usecols=lambda col: col in columnas_a_leer,
+        )
+        categoricas = [col for col in COLUMNAS_CATEGORICAS if col in df_programas.columns]
+        df_programas[categoricas] = df_programas[categoricas].astype("category")
+        _reducir_codigos(df_programas)
         log_info(f"Archivo de programas cargado: {ARCHIVO_PROGRAMAS.name}")
     except PermissionError as e:
         error_msg = (
@@ -244,25 +557,28 @@ def actualizar_historico_programas_nuevos() -> None:
         log_error(error_msg)
         raise ValueError(error_msg)
     
-    # Filtrar solo programas nuevos
-    df_nuevos = df_programas[df_programas["PROGRAMA_NUEVO"] == "Sí"].copy()
+    # Máscara de programas nuevos (PROGRAMA_NUEVO es category: se compara sobre códigos enteros)
+    mask_nuevos = df_programas["PROGRAMA_NUEVO"].eq("Sí")
+    total_nuevos = int(mask_nuevos.sum())
     
-    if len(df_nuevos) == 0:
+    if total_nuevos == 0:
         info_msg = "No hay programas nuevos para agregar al histórico."
         print(info_msg)
         log_info(info_msg)
         return
     
-    print(f"Programas nuevos detectados: {len(df_nuevos)}")
+    print(f"Programas nuevos detectados: {total_nuevos}")
     
-    # Verificar que todas las columnas requeridas existen
+    # Verificar que todas las columnas requeridas existen (set: búsqueda O(1) y conserva el orden)
+    columnas_programas = set(df_programas.columns)
     columnas_faltantes = [
-        col for col in COLUMNAS_REQUERIDAS if col not in df_nuevos.columns
+        col for col in COLUMNAS_REQUERIDAS if col not in columnas_programas
     ]
+    crear_area_vacia = False
     if columnas_faltantes:
         # Si falta ÁREA_DE_CONOCIMIENTO, crear la columna vacía (puede no existir si aún no se ha imputado)
         if "ÁREA_DE_CONOCIMIENTO" in columnas_faltantes:
-            df_nuevos["ÁREA_DE_CONOCIMIENTO"] = None
+            crear_area_vacia = True
             columnas_faltantes.remove("ÁREA_DE_CONOCIMIENTO")
             log_info("Columna ÁREA_DE_CONOCIMIENTO no encontrada, se creará vacía en el histórico")
         
@@ -275,8 +591,12 @@ def actualizar_historico_programas_nuevos() -> None:
             log_error(error_msg)
             raise ValueError(error_msg)
     
-    # Seleccionar solo las columnas requeridas que se extraen de Programas.xlsx
-    df_extraido = df_nuevos[COLUMNAS_REQUERIDAS].copy()
+    # Filtrar programas nuevos y seleccionar las columnas requeridas en un solo paso
+    # (.loc con filas y columnas ya devuelve un DataFrame nuevo: no hace falta .copy())
+    columnas_extraer = [col for col in COLUMNAS_REQUERIDAS if col in columnas_programas]
+    df_extraido = df_programas.loc[mask_nuevos, columnas_extraer]
+    if crear_area_vacia:
+        df_extraido["ÁREA_DE_CONOCIMIENTO"] = None
     
     # Log para verificar que se están guardando las áreas
     if "ÁREA_DE_CONOCIMIENTO" in df_extraido.columns:
@@ -287,11 +607,14 @@ def actualizar_historico_programas_nuevos() -> None:
             print(f"✓ {areas_asignadas} programas nuevos tienen área de conocimiento asignada")
     
     # Agregar la fecha de ejecución
-    fecha_ejecucion = datetime.datetime.now().strftime("%Y-%m-%d")
     df_extraido.insert(0, COLUMNA_FECHA, fecha_ejecucion)
     
-    # Inicializar variable para el orden de columnas
-    columnas_orden_historico = None
+    # Camino rápido: si el histórico ya tiene el esquema completo, solo se anexan las filas nuevas
+    total_registros = _anexar_historico(df_extraido)
+    if total_registros is not None:
+        print(f"✓ Archivo histórico actualizado: {len(df_extraido)} registros anexados, {total_registros} registros totales")
+        log_info(f"Archivo histórico actualizado: {ARCHIVO_HISTORICO.name} ({total_registros} registros totales)")
+        return
     
     # Buscar y consolidar archivos históricos existentes (maneja duplicados con/sin espacio)
     df_historico_existente = _consolidar_archivos_historicos_duplicados()
@@ -302,12 +625,13 @@ def actualizar_historico_programas_nuevos() -> None:
         
         # Obtener el orden de columnas del archivo histórico existente
         columnas_orden_historico = list(df_historico_existente.columns)
+        columnas_historico = set(columnas_orden_historico)
         
         # Verificar y agregar columnas faltantes al histórico existente (migración de esquema)
         # Esto permite que históricos antiguos se actualicen con nuevas columnas sin perder datos
         columnas_faltantes_en_historico = [
             col for col in [COLUMNA_FECHA] + COLUMNAS_REQUERIDAS 
-            if col not in columnas_orden_historico
+            if col not in columnas_historico
         ]
         if columnas_faltantes_en_historico:
             # Agregar columnas faltantes al histórico existente con valores None/NaN para registros antiguos
@@ -319,54 +643,27 @@ def actualizar_historico_programas_nuevos() -> None:
             columnas_orden_historico = list(df_historico_existente.columns)
             log_info(f"Histórico actualizado con nuevas columnas. Total de columnas: {len(columnas_orden_historico)}")
         
-        # Construir DataFrame con todas las columnas en el orden correcto
-        df_para_historico = pd.DataFrame(index=df_extraido.index)
-        
-        # Agregar cada columna en el orden del histórico
-        for col in columnas_orden_historico:
-            if col in df_extraido.columns:
-                # Si la columna se extrae de Programas.xlsx, usar su valor
-                df_para_historico[col] = df_extraido[col]
-            else:
-                # Si la columna no se extrae, rellenar con None/NaN
-                df_para_historico[col] = None
+        # Construir DataFrame con todas las columnas en el orden del histórico
+        # (las que no se extraen de Programas.xlsx quedan vacías)
+        df_para_historico = df_extraido.reindex(columns=columnas_orden_historico)
         
         # Concatenar los nuevos registros con los existentes (sin eliminar ningún registro)
+        _alinear_categorias(df_historico_existente, df_para_historico)
         df_historico_final = pd.concat(
-            [df_historico_existente, df_para_historico], ignore_index=True
+            [df_historico_existente, df_para_historico], ignore_index=True, sort=False, copy=False
         )
         print(f"Total de registros en histórico: {len(df_historico_final)}")
     else:
         print("No existe archivo histórico. Creando nuevo archivo.")
         # Crear DataFrame con todas las columnas en el orden definido
-        df_para_historico = pd.DataFrame(index=df_extraido.index)
-        for col in COLUMNAS_ORDEN_HISTORICO:
-            if col in df_extraido.columns:
-                df_para_historico[col] = df_extraido[col]
-            else:
-                df_para_historico[col] = None
-        df_historico_final = df_para_historico
-    
-    # Asegurar que las columnas estén en el orden correcto
-    # Si existe histórico, usar su orden; si no, usar el orden definido
-    if columnas_orden_historico is not None:
-        orden_columnas = columnas_orden_historico
-    else:
-        orden_columnas = COLUMNAS_ORDEN_HISTORICO
+        df_historico_final = df_extraido.reindex(columns=COLUMNAS_ORDEN_HISTORICO)
     
-    # Reordenar columnas según el orden esperado (solo las que existen)
-    columnas_existentes = [col for col in orden_columnas if col in df_historico_final.columns]
-    columnas_adicionales = [col for col in df_historico_final.columns if col not in orden_columnas]
-    df_historico_final = df_historico_final[columnas_existentes + columnas_adicionales]
+    # Las columnas ya quedan en el orden del histórico (o COLUMNAS_ORDEN_HISTORICO si es nuevo)
+    # porque ambas ramas construyen las filas nuevas con reindex: no hace falta reordenar.
     
     # Guardar el archivo histórico
     print(f"Guardando archivo histórico: {ARCHIVO_HISTORICO}")
-    with pd.ExcelWriter(
-        ARCHIVO_HISTORICO,
-        mode="w",
-        engine="openpyxl",
-    ) as writer:
-        df_historico_final.to_excel(writer, sheet_name=HOJA_HISTORICO, index=False)
+    guardar_historico(df_historico_final)
     
     print(f"✓ Archivo histórico guardado: {len(df_historico_final)} registros totales")
     log_info(f"Archivo histórico guardado: {ARCHIVO_HISTORICO.name} ({len(df_historico_final)} registros totales)")
@@ -386,7 +683,6 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
         * Si ES_REFERENTE == 'No', entonces PROGRAMA_EAFIT_CODIGO y PROGRAMA_EAFIT_NOMBRE
           se dejan nulos / vacíos en el histórico.
     """
-    from etl.exceptions_helpers import leer_excel_con_reintentos, escribir_excel_con_reintentos
 
     log_info("Iniciando retro-sincronización del histórico con ajustes manuales...")
 
@@ -398,7 +694,7 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
         msg = f"No se encontró Programas.xlsx en: {ARCHIVO_PROGRAMAS}"
         log_warning(msg)
         return
-    if not ARCHIVO_HISTORICO.exists():
+    if not existe_historico():
         msg = f"No se encontró el archivo histórico: {ARCHIVO_HISTORICO}"
         log_warning(msg)
         return
@@ -414,7 +710,7 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
 
     # Leer histórico
     try:
-        df_historico = leer_excel_con_reintentos(ARCHIVO_HISTORICO, sheet_name=HOJA_HISTORICO)
+        df_historico = leer_historico()
         log_info(f"Archivo histórico cargado para sincronización: {ARCHIVO_HISTORICO.name}")
     except Exception as exc:
         error_msg = f"No se pudo leer HistoricoProgramasNuevos para sincronización: {exc}"
@@ -439,23 +735,15 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
             "No se encontró la columna AJUSTE_MANUAL en Programas.xlsx. "
             "Se considerarán todos los registros para sincronización."
         )
-        df_ajustes = df_programas.copy()
+        df_ajustes = df_programas
 
     if df_ajustes.empty:
         log_info("No hay ajustes manuales para sincronizar en el histórico.")
         return
 
-    # Normalización de códigos para emparejar de forma robusta
-    def _normalizar_codigo(valor: object) -> str:
-        if pd.isna(valor):
-            return ""
-        s = str(valor).strip().upper()
-        if s.endswith(".0"):
-            s = s[:-2]
-        return s
-
-    df_ajustes["_CODIGO_NORM"] = df_ajustes["CÓDIGO_SNIES_DEL_PROGRAMA"].apply(_normalizar_codigo)
-    df_historico["_CODIGO_NORM"] = df_historico["CÓDIGO_SNIES_DEL_PROGRAMA"].apply(_normalizar_codigo)
+    # Clave entera (hash 64 bits del código normalizado) para emparejar de forma robusta
+    df_ajustes["_CODIGO_KEY"] = _clave_codigo_snies(df_ajustes["CÓDIGO_SNIES_DEL_PROGRAMA"])
+    df_historico["_CODIGO_KEY"] = _clave_codigo_snies(df_historico["CÓDIGO_SNIES_DEL_PROGRAMA"])
 
     # Preparar subconjunto de columnas a sincronizar
     columnas_sync = ["ES_REFERENTE", "PROGRAMA_EAFIT_CODIGO", "PROGRAMA_EAFIT_NOMBRE"]
@@ -464,25 +752,27 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
             df_ajustes[col] = None
         if col not in df_historico.columns:
             df_historico[col] = None
+        elif isinstance(df_historico[col].dtype, pd.CategoricalDtype) or pd.api.types.is_integer_dtype(
+            df_historico[col].dtype
+        ):
+            # Los valores ajustados pueden no estar entre las categorías guardadas ni caber
+            # en el entero reducido (o ser nulos al limpiar PROGRAMA_EAFIT_*)
+            df_historico[col] = df_historico[col].astype(object)
 
     # Reducir df_ajustes a una fila por código normalizado (último ajuste)
-    cols_ajustes = ["_CODIGO_NORM"] + columnas_sync
-    df_ajustes_keys = (
-        df_ajustes[cols_ajustes]
-        .dropna(subset=["_CODIGO_NORM"])
-        .drop_duplicates(subset=["_CODIGO_NORM"], keep="last")
-    )
+    cols_ajustes = ["_CODIGO_KEY"] + columnas_sync
+    df_ajustes_keys = df_ajustes[cols_ajustes].drop_duplicates(subset=["_CODIGO_KEY"], keep="last")
 
     if df_ajustes_keys.empty:
         log_info("No hay códigos válidos para sincronizar en el histórico.")
         return
 
-    codigos_ajustados = set(df_ajustes_keys["_CODIGO_NORM"])
+    codigos_ajustados = df_ajustes_keys["_CODIGO_KEY"].to_numpy()
 
     # Hacer merge para obtener valores de ajustes en el histórico
     df_merge = df_historico.merge(
         df_ajustes_keys,
-        on="_CODIGO_NORM",
+        on="_CODIGO_KEY",
         how="left",
         suffixes=("", "_AJUSTE"),
     )
@@ -511,27 +801,25 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
             .isin(["NO", "0", "FALSE", "N"])
         )
         # Solo aplicar en códigos que vienen de ajustes
-        mask_en_ajustes = df_merge["_CODIGO_NORM"].isin(codigos_ajustados)
+        mask_en_ajustes = df_merge["_CODIGO_KEY"].isin(codigos_ajustados)
         mask_limpiar = es_no & mask_en_ajustes
         if mask_limpiar.any():
             df_merge.loc[mask_limpiar, ["PROGRAMA_EAFIT_CODIGO", "PROGRAMA_EAFIT_NOMBRE"]] = None
 
+    # Programas afectados (filas del histórico cuyo código fue ajustado)
+    total_afectados = int(df_merge["_CODIGO_KEY"].isin(codigos_ajustados).sum())
+
     # Limpiar columna técnica
-    df_merge = df_merge.drop(columns=["_CODIGO_NORM"])
+    df_merge = df_merge.drop(columns=["_CODIGO_KEY"])
 
     # Guardar histórico actualizado
     try:
-        escribir_excel_con_reintentos(
-            ARCHIVO_HISTORICO,
-            df_merge,
-            sheet_name=HOJA_HISTORICO,
-        )
+        guardar_historico(df_merge)
     except Exception as exc:
         error_msg = f"Error al guardar el histórico sincronizado: {exc}"
         log_error(error_msg)
         raise
 
-    total_afectados = len(df_merge[df_merge["CÓDIGO_SNIES_DEL_PROGRAMA"].apply(_normalizar_codigo).isin(codigos_ajustados)])
     log_resultado(
         f"Sincronización de histórico completada. Registros actualizados (por fila): {registros_actualizados}, "
         f"programas afectados: {total_afectados}"
@@ -540,4 +828,7 @@ def sincronizar_historico_con_ajustes_manuales() -> None:
 
 
 if __name__ == "__main__":
-    actualizar_historico_programas_nuevos()
+    if "--exportar-xlsx" in sys.argv:
+        exportar_historico_xlsx()
+    else:
+        actualizar_historico_programas_nuevos()
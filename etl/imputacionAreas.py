@@ -13,44 +13,285 @@ Diseñado para ser extensible a otras columnas en el futuro (ej. NÚCLEO_BÁSICO
 
 from __future__ import annotations
 
+import hashlib
+import os
+import sys
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
-from sklearn.neighbors import KNeighborsClassifier
 
 if TYPE_CHECKING:
     from sentence_transformers import SentenceTransformer
 
 from etl.pipeline_logger import log_error, log_info, log_warning
-from etl.config import ARCHIVO_PROGRAMAS, HOJA_PROGRAMAS
+from etl.config import ARCHIVO_PROGRAMAS, EMBEDDINGS_BACKEND_ONNX, HOJA_PROGRAMAS
 from etl.exceptions_helpers import (
     leer_excel_con_reintentos,
     escribir_excel_con_reintentos,
     explicar_error_archivo_abierto,
 )
-from etl.normalizacion import limpiar_texto
-from etl.clasificacionProgramas import _get_sentence_transformer, MODELO_EMBEDDINGS
 
+# etl.clasificacionProgramas (y con él sklearn/scipy) se importa solo al usar el modelo de
+# embeddings, para que importar este módulo no cueste el arranque de la pila de ML.
 
-def _es_valor_faltante(valor: object) -> bool:
+
+# Longitud máxima (tokens) de los nombres de programa al generar embeddings
+MAX_TOKENS_NOMBRE = 64
+
+# Versión del formato de la caché de embeddings (las claves son el SHA-1 del texto codificado).
+# Las cachés de otra versión se descartan al cargarlas.
+FORMATO_CACHE_EMBEDDINGS = 2
+
+# Textos que se consideran faltantes (comparados tras strip + lower)
+VALORES_FALTANTES = frozenset(["", "sin clasificar", "sin clasificacion", "n/a", "na", "none", "null"])
+
+
+def _mascara_faltantes(serie: pd.Series) -> pd.Series:
     """
-    Determina si un valor se considera faltante para imputación.
+    Determina qué valores de una columna se consideran faltantes para imputación.
     
     Args:
-        valor: Valor a evaluar
+        serie: Columna a evaluar
         
     Returns:
-        True si el valor se considera faltante, False en caso contrario
+        Serie booleana (True si el valor se considera faltante)
+    """
+    # La columna tiene pocas categorías distintas: se normalizan y comparan solo los valores
+    # únicos (factorize: una pasada de hash en C) y el resultado se expande por código
+    codigos, unicos = pd.factorize(serie)
+    unicos_faltantes = (
+        pd.Series(unicos, dtype=object).astype(str).str.strip().str.lower().isin(VALORES_FALTANTES).to_numpy()
+    )
+    mascara = np.where(codigos == -1, True, unicos_faltantes[codigos] if len(unicos) else False)
+    return pd.Series(mascara, index=serie.index)
+
+
+def _ruta_cache_embeddings() -> Path:
+    """Ruta de la caché en disco de embeddings para el modelo actual (en TEMP_DIR)."""
+    from etl.clasificacionProgramas import MODELO_EMBEDDINGS
+    from etl.config import TEMP_DIR
+
+    return TEMP_DIR / f"embeddings_{MODELO_EMBEDDINGS}.npz"
+
+
+def _cargar_cache_embeddings(ruta: Path) -> tuple[dict[str, int], np.ndarray | None]:
+    """
+    Carga la caché de embeddings: índice clave -> fila y matriz float16 de vectores.
+    
+    Si el archivo no existe, está dañado o es de otro formato se devuelve una caché vacía.
+    """
+    if not ruta.exists():
+        return {}, None
+    try:
+        with np.load(ruta, allow_pickle=False) as datos:
+            if "formato" not in datos.files or int(datos["formato"]) != FORMATO_CACHE_EMBEDDINGS:
+                log_info(f"Caché de embeddings {ruta.name} de un formato anterior: se regenerará")
+                return {}, None
+            claves = datos["claves"].tolist()
+            vectores = datos["vectores"]
+    except Exception as e:
+        log_warning(f"No se pudo leer la caché de embeddings {ruta.name}: {e}. Se regenerará.")
+        return {}, None
+    return {clave: i for i, clave in enumerate(claves)}, vectores
+
+
+def _guardar_cache_embeddings(ruta: Path, indice: dict[str, int], vectores: np.ndarray) -> None:
+    """Guarda la caché de forma atómica (archivo temporal + os.replace)."""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    claves = np.array(sorted(indice, key=indice.get))
+    ruta_tmp = ruta.with_name(f"{ruta.stem}.tmp.npz")
+    np.savez(
+        ruta_tmp,
+        formato=np.int64(FORMATO_CACHE_EMBEDDINGS),
+        claves=claves,
+        vectores=vectores.astype(np.float16),
+    )
+    os.replace(ruta_tmp, ruta)
+
+
+def _codificar_textos(
+    modelo_embeddings: "SentenceTransformer",
+    textos: list[str],
+    batch_size: int,
+) -> np.ndarray:
+    """Codifica textos con el modelo y devuelve los vectores en float16."""
+    # En entornos .exe, deshabilitar barra de progreso para evitar problemas con stdout
+    is_exe = getattr(sys, 'frozen', False)
+    return modelo_embeddings.encode(
+        textos,
+        show_progress_bar=not is_exe,  # Deshabilitar en .exe
+        batch_size=batch_size,
+        convert_to_numpy=True,
+    ).astype(np.float16)
+
+
+def _generar_embeddings(
+    modelo_embeddings: "SentenceTransformer",
+    textos: list[str],
+    batch_size: int,
+) -> np.ndarray:
+    """
+    Genera embeddings reutilizando la caché en disco entre ejecuciones.
+    
+    La clave es el SHA-1 del texto tal como se codifica, de modo que solo los nombres nunca
+    vistos pasan por el modelo y el resultado no depende del orden de las filas. La caché se
+    lee y se escribe una vez por llamada y solo conserva los textos de esa llamada (no crece
+    con nombres que ya no están en Programas). Los vectores se guardan en float16 y se
+    devuelven en float32, en el mismo orden que textos.
+    """
+    ruta_cache = _ruta_cache_embeddings()
+    indice, vectores_cache = _cargar_cache_embeddings(ruta_cache)
+    
+    # Caché de otra dimensión (modelo distinto con el mismo nombre): se descarta antes de
+    # buscar las claves, para que todos los textos pedidos se vuelvan a codificar
+    obtener_dimension = getattr(modelo_embeddings, "get_sentence_embedding_dimension", None)
+    dimension = obtener_dimension() if obtener_dimension is not None else None
+    if vectores_cache is not None and dimension is not None and vectores_cache.shape[1] != dimension:
+        log_info(f"Caché de embeddings {ruta_cache.name} de otra dimensión: se descarta")
+        indice, vectores_cache = {}, None
+    
+    claves = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in textos]
+    texto_por_clave_nueva: dict[str, str] = {}
+    for clave, texto in zip(claves, textos):
+        if clave not in indice and clave not in texto_por_clave_nueva:
+            texto_por_clave_nueva[clave] = texto
+    
+    if texto_por_clave_nueva:
+        log_info(
+            f"Caché de embeddings: {len(texto_por_clave_nueva)} nombres nuevos a codificar, "
+            f"{len(indice)} ya en caché"
+        )
+        embeddings_nuevos = _codificar_textos(
+            modelo_embeddings, list(texto_por_clave_nueva.values()), batch_size
+        )
+        if vectores_cache is not None and vectores_cache.shape[1:] != embeddings_nuevos.shape[1:]:
+            # El modelo no informó su dimensión y no coincide con la de la caché: se descarta
+            # la caché y se codifican todos los textos pedidos
+            log_info(f"Caché de embeddings {ruta_cache.name} de otra dimensión: se descarta")
+            indice, vectores_cache = {}, None
+            texto_por_clave_nueva = dict(zip(claves, textos))
+            embeddings_nuevos = _codificar_textos(
+                modelo_embeddings, list(texto_por_clave_nueva.values()), batch_size
+            )
+        inicio = len(indice)
+        for i, clave in enumerate(texto_por_clave_nueva):
+            indice[clave] = inicio + i
+        if vectores_cache is None:
+            vectores_cache = embeddings_nuevos
+        else:
+            vectores_cache = np.concatenate([vectores_cache, embeddings_nuevos])
+    
+    # Conservar solo las claves usadas en esta llamada, en el orden en que aparecen
+    claves_usadas = list(dict.fromkeys(claves))
+    if texto_por_clave_nueva or len(indice) != len(claves_usadas):
+        filas_usadas = np.fromiter((indice[clave] for clave in claves_usadas), dtype=np.intp, count=len(claves_usadas))
+        vectores_cache = np.take(vectores_cache, filas_usadas, axis=0)
+        indice = {clave: i for i, clave in enumerate(claves_usadas)}
+        try:
+            _guardar_cache_embeddings(ruta_cache, indice, vectores_cache)
+        except Exception as e:
+            log_warning(f"No se pudo guardar la caché de embeddings {ruta_cache.name}: {e}")
+    
+    filas = np.fromiter((indice[clave] for clave in claves), dtype=np.intp, count=len(claves))
+    return np.take(vectores_cache, filas, axis=0).astype(np.float32)
+
+
+def _normalizar_filas(matriz: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma L2 = 1 (las filas nulas se dejan en cero)."""
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return matriz / normas
+
+
+def _knn_coseno_ponderado(
+    embeddings_referencia: np.ndarray,
+    etiquetas: np.ndarray,
+    embeddings_consulta: np.ndarray,
+    n_neighbors: int,
+    tamano_bloque: int = 1024,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Clasifica cada consulta por voto de sus n_neighbors vecinos más cercanos (distancia coseno),
+    ponderado por el inverso de la distancia.
+    
+    Equivale a KNeighborsClassifier(weights='distance', metric='cosine'), pero las similitudes
+    se obtienen con un producto de matrices sobre vectores normalizados, por bloques de
+    consultas para acotar la memoria.
+    
+    Returns:
+        Tupla (etiqueta predicha por consulta, confianza de cada predicción)
     """
-    if pd.isna(valor):
-        return True
+    clases, codigos = np.unique(etiquetas, return_inverse=True)
+    referencia = _normalizar_filas(embeddings_referencia)
+    consulta = _normalizar_filas(embeddings_consulta)
+    k = min(n_neighbors, len(referencia))
+    
+    predichos = np.empty(len(consulta), dtype=np.intp)
+    confianzas = np.empty(len(consulta), dtype=np.float64)
+    for inicio in range(0, len(consulta), tamano_bloque):
+        similitudes = consulta[inicio:inicio + tamano_bloque] @ referencia.T
+        vecinos = np.argpartition(-similitudes, k - 1, axis=1)[:, :k]
+        distancias = np.clip(1.0 - np.take_along_axis(similitudes, vecinos, axis=1), 0.0, 2.0)
+        
+        # Igual que sklearn: si hay vecinos a distancia 0, solo ellos votan
+        with np.errstate(divide="ignore"):
+            pesos = 1.0 / distancias
+        exactos = distancias == 0
+        filas_exactas = exactos.any(axis=1)
+        pesos[filas_exactas] = exactos[filas_exactas]
+        
+        votos = np.zeros((len(vecinos), len(clases)))
+        np.add.at(votos, (np.arange(len(vecinos))[:, None], codigos[vecinos]), pesos)
+        fin = inicio + len(vecinos)
+        predichos[inicio:fin] = votos.argmax(axis=1)
+        confianzas[inicio:fin] = votos.max(axis=1) / votos.sum(axis=1)
     
-    valor_str = str(valor).strip().lower()
-    valores_faltantes = ["", "sin clasificar", "sin clasificacion", "n/a", "na", "none", "null"]
+    return clases[predichos], confianzas
+
+
+def _seleccionar_dispositivo() -> str:
+    """Devuelve el dispositivo para el modelo de embeddings: 'cuda' o 'mps' si hay acelerador, si no 'cpu'."""
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def _cargar_modelo_embeddings(SentenceTransformer: type, dispositivo: str) -> "SentenceTransformer":
+    """
+    Carga el modelo de embeddings en el dispositivo indicado.
     
-    return valor_str in valores_faltantes
+    En CPU, si EMBEDDINGS_BACKEND_ONNX está activo, intenta el backend ONNX Runtime de
+    sentence-transformers (grafo con kernels fusionados); si la versión instalada no lo
+    soporta o falta onnxruntime, se usa el backend PyTorch.
+    """
+    from etl.clasificacionProgramas import MODELO_EMBEDDINGS
+
+    modelo = None
+    if dispositivo == "cpu" and EMBEDDINGS_BACKEND_ONNX:
+        try:
+            modelo = SentenceTransformer(MODELO_EMBEDDINGS, device=dispositivo, backend="onnx")
+            log_info("Modelo de embeddings cargado con backend ONNX Runtime")
+        except Exception as e:
+            log_warning(f"No se pudo usar el backend ONNX para embeddings: {e}. Se usará PyTorch.")
+    if modelo is None:
+        modelo = SentenceTransformer(MODELO_EMBEDDINGS, device=dispositivo)
+        if dispositivo == "cuda":
+            # fp16 en GPU: usa tensor cores y reduce a la mitad la memoria del modelo
+            modelo.half()
+    # Los nombres de programa son cortos: truncar en MAX_TOKENS_NOMBRE acota el costo de los
+    # pocos nombres largos (encode ya rellena cada lote solo hasta su texto más largo)
+    modelo.max_seq_length = min(modelo.max_seq_length or MAX_TOKENS_NOMBRE, MAX_TOKENS_NOMBRE)
+    return modelo
 
 
 def imputar_columna(
@@ -77,7 +318,9 @@ def imputar_columna(
         batch_size: Tamaño de lote para generar embeddings (default: 32)
         
     Returns:
-        Tupla (DataFrame con valores imputados, número de valores imputados)
+        Tupla (DataFrame con valores imputados, número de valores imputados). Es el mismo
+        objeto df: solo se reemplaza la columna target; quien necesite conservar el original
+        debe pasar una copia.
         
     Raises:
         ValueError: Si la columna target o nombre no existen en el DataFrame
@@ -90,19 +333,20 @@ def imputar_columna(
     if columna_nombre not in df.columns:
         raise ValueError(f"La columna '{columna_nombre}' no existe en el DataFrame")
     
-    # Crear copia para no modificar el original
-    df_resultado = df.copy()
+    # Sin copiar el DataFrame completo: solo se reemplaza la columna target al final
+    df_resultado = df
+    columnas_knn = [columna_nombre, columna_target]
     
     # Identificar filas con valores faltantes
-    mask_faltantes = df_resultado[columna_target].apply(_es_valor_faltante)
-    filas_faltantes = df_resultado[mask_faltantes]
+    mask_faltantes = _mascara_faltantes(df_resultado[columna_target])
+    filas_faltantes = df_resultado.loc[mask_faltantes, columnas_knn]
     
     if len(filas_faltantes) == 0:
         log_info(f"No hay valores faltantes en la columna '{columna_target}'")
         return df_resultado, 0
     
     # Identificar filas con valores asignados (no faltantes)
-    filas_con_valor = df_resultado[~mask_faltantes]
+    filas_con_valor = df_resultado.loc[~mask_faltantes, columnas_knn]
     
     if len(filas_con_valor) == 0:
         log_warning(
@@ -133,65 +377,36 @@ def imputar_columna(
         lambda x: str(x) if pd.notna(x) else ""
     ).tolist()
     
-    # Generar embeddings para programas con valores asignados
-    log_info(f"Generando embeddings para {len(textos_con_valor)} programas de referencia...")
-    try:
-        import sys
-        # En entornos .exe, deshabilitar barra de progreso para evitar problemas con stdout
-        is_exe = getattr(sys, 'frozen', False)
-        embeddings_con_valor = modelo_embeddings.encode(
-            textos_con_valor,
-            show_progress_bar=not is_exe,  # Deshabilitar en .exe
-            batch_size=batch_size,
-            convert_to_numpy=True,
-        )
-    except Exception as e:
-        error_msg = f"Error al generar embeddings para programas de referencia: {e}"
-        log_error(error_msg)
-        raise RuntimeError(error_msg) from e
-    
-    # Generar embeddings para programas con valores faltantes
-    log_info(f"Generando embeddings para {len(textos_faltantes)} programas con valores faltantes...")
+    # Un solo paso por la caché de embeddings para referencias y faltantes
+    log_info(
+        f"Generando embeddings para {len(textos_con_valor)} programas de referencia "
+        f"y {len(textos_faltantes)} programas con valores faltantes..."
+    )
     try:
-        import sys
-        # En entornos .exe, deshabilitar barra de progreso para evitar problemas con stdout
-        is_exe = getattr(sys, 'frozen', False)
-        embeddings_faltantes = modelo_embeddings.encode(
-            textos_faltantes,
-            show_progress_bar=not is_exe,  # Deshabilitar en .exe
-            batch_size=batch_size,
-            convert_to_numpy=True,
-        )
+        embeddings = _generar_embeddings(modelo_embeddings, textos_con_valor + textos_faltantes, batch_size)
     except Exception as e:
-        error_msg = f"Error al generar embeddings para programas faltantes: {e}"
+        error_msg = f"Error al generar embeddings de programas: {e}"
         log_error(error_msg)
         raise RuntimeError(error_msg) from e
+    embeddings_con_valor = embeddings[:len(textos_con_valor)]
+    embeddings_faltantes = embeddings[len(textos_con_valor):]
     
     # Preparar datos para KNN: usar los valores asignados como "etiquetas"
-    valores_asignados = filas_con_valor[columna_target].astype(str).tolist()
+    valores_asignados = filas_con_valor[columna_target].astype(str).to_numpy()
     
-    # Entrenar KNN con los programas que tienen valores asignados
-    log_info(f"Entrenando KNN con {len(embeddings_con_valor)} muestras de entrenamiento...")
+    # KNN coseno ponderado por distancia contra los programas que tienen valores asignados
+    log_info(
+        f"Prediciendo valores para {len(embeddings_faltantes)} programas faltantes "
+        f"con {len(embeddings_con_valor)} muestras de referencia..."
+    )
     try:
-        knn = KNeighborsClassifier(
+        valores_imputados, confianzas = _knn_coseno_ponderado(
+            embeddings_con_valor,
+            valores_asignados,
+            embeddings_faltantes,
             n_neighbors=n_neighbors,
-            weights='distance',  # Los vecinos más cercanos tienen más peso
-            algorithm='auto',
-            metric='cosine',  # Usar distancia coseno para embeddings semánticos
         )
-        knn.fit(embeddings_con_valor, valores_asignados)
-    except Exception as e:
-        error_msg = f"Error al entrenar KNN: {e}"
-        log_error(error_msg)
-        raise RuntimeError(error_msg) from e
-    
-    # Predecir valores para los programas faltantes
-    log_info(f"Prediciendo valores para {len(embeddings_faltantes)} programas faltantes...")
-    try:
-        valores_imputados = knn.predict(embeddings_faltantes)
-        # Obtener probabilidades para logging
-        probabilidades = knn.predict_proba(embeddings_faltantes)
-        confianza_promedio = np.mean(np.max(probabilidades, axis=1))
+        confianza_promedio = np.mean(confianzas)
         log_info(f"Confianza promedio de las predicciones: {confianza_promedio:.2%}")
     except Exception as e:
         error_msg = f"Error al predecir valores con KNN: {e}"
@@ -199,8 +414,9 @@ def imputar_columna(
         raise RuntimeError(error_msg) from e
     
     # Asignar valores imputados al DataFrame
-    indices_faltantes = filas_faltantes.index
-    df_resultado.loc[indices_faltantes, columna_target] = valores_imputados
+    columna_imputada = df_resultado[columna_target].astype(object)
+    columna_imputada[mask_faltantes.to_numpy()] = valores_imputados
+    df_resultado[columna_target] = columna_imputada
     
     # Log de resumen
     valores_unicos_imputados = pd.Series(valores_imputados).value_counts()
@@ -229,11 +445,12 @@ def ejecutar_imputacion_areas(
         DataFrame con valores imputados en ÁREA_DE_CONOCIMIENTO
         
     Si df es None, lee desde archivo y escribe de vuelta.
-    Si df se proporciona, solo imputa y retorna (sin I/O).
+    Si df se proporciona, solo imputa y retorna (sin I/O); la columna ÁREA_DE_CONOCIMIENTO
+    se reemplaza en el mismo df (pasar una copia si se necesita el original).
     """
     # Cargar datos
     if df is not None:
-        df_procesar = df.copy()
+        df_procesar = df
         log_info(f"Imputando ÁREA_DE_CONOCIMIENTO en DataFrame en memoria ({len(df_procesar)} filas)")
     else:
         archivo = archivo or ARCHIVO_PROGRAMAS
@@ -270,7 +487,7 @@ def ejecutar_imputacion_areas(
         raise ValueError(error_msg)
     
     # Contar valores faltantes antes de imputar
-    mask_faltantes_antes = df_procesar[columna_target].apply(_es_valor_faltante)
+    mask_faltantes_antes = _mascara_faltantes(df_procesar[columna_target])
     cantidad_faltantes = mask_faltantes_antes.sum()
     
     if cantidad_faltantes == 0:
@@ -283,6 +500,8 @@ def ejecutar_imputacion_areas(
     log_info(f"Iniciando imputación de '{columna_target}': {cantidad_faltantes} valores faltantes detectados")
     
     # Cargar modelo de embeddings una sola vez (reutilizable)
+    from etl.clasificacionProgramas import _get_sentence_transformer, MODELO_EMBEDDINGS
+
     log_info(f"Cargando modelo de embeddings: {MODELO_EMBEDDINGS}")
     try:
         import sys
@@ -303,9 +522,10 @@ def ejecutar_imputacion_areas(
         
         try:
             SentenceTransformer = _get_sentence_transformer()
+            dispositivo = _seleccionar_dispositivo()
             # Cargar modelo con show_progress_bar=False para evitar problemas con stdout
-            modelo_embeddings = SentenceTransformer(MODELO_EMBEDDINGS)
-            log_info("Modelo de embeddings cargado exitosamente")
+            modelo_embeddings = _cargar_modelo_embeddings(SentenceTransformer, dispositivo)
+            log_info(f"Modelo de embeddings cargado exitosamente (dispositivo: {dispositivo})")
         finally:
             # Restaurar stdout/stderr originales
             sys.stdout = stdout_backup
@@ -331,7 +551,7 @@ def ejecutar_imputacion_areas(
             columna_nombre=columna_nombre,
             modelo_embeddings=modelo_embeddings,
             n_neighbors=5,
-            batch_size=32,
+            batch_size=32 if dispositivo == "cpu" else 128,
         )
         
         log_info(f"Imputación completada: {valores_imputados} valores imputados en '{columna_target}'")
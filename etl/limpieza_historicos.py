@@ -8,7 +8,9 @@ evitar que la carpeta se llene de archivos.
 
 from __future__ import annotations
 
+import os
 import sys
+import time
 from pathlib import Path
 
 import pandas as pd
@@ -18,12 +20,13 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+from etl.exceptions_helpers import leer_excel_con_reintentos
+from etl.historicoProgramasNuevos import existe_historico, guardar_historico, leer_historico
 from etl.pipeline_logger import log_error, log_info, log_resultado
 from etl.config import (
     HISTORIC_DIR,
     ARCHIVO_HISTORICO,
     HOJA_PROGRAMAS,
-    HOJA_HISTORICO,
     MAX_ARCHIVOS_HISTORICOS,
 )
 
@@ -31,6 +34,16 @@ from etl.config import (
 UMBRAL_CONSOLIDACION = MAX_ARCHIVOS_HISTORICOS
 
 
+def _primero_por_clave(df: pd.DataFrame, columnas: list[str]) -> pd.DataFrame:
+    """
+    Conserva la primera fila de cada clave (df ya viene ordenado, la primera es la más reciente).
+    
+    Equivale a drop_duplicates(keep="first"), pero en una sola pasada de groupby sin construir
+    la máscara de duplicados; dropna=False mantiene, como antes, una fila para claves nulas.
+    """
+    return df.groupby(columnas, sort=False, dropna=False).head(1)
+
+
 def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]:
     """
     Consolida archivos históricos en HistoricoProgramasNuevos.xlsx y elimina los archivos consolidados.
@@ -48,11 +61,16 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
         log_info("No existe el directorio histórico. No hay nada que consolidar.")
         return (0, 0)
     
-    # Obtener todos los archivos .xlsx en el directorio histórico
-    archivos_historicos = sorted(
-        [f for f in HISTORIC_DIR.glob("*.xlsx") if f.is_file()],
-        key=lambda x: x.stat().st_mtime  # Ordenar por fecha de modificación (más antiguos primero)
-    )
+    # Obtener todos los archivos .xlsx en el directorio histórico con un solo recorrido:
+    # os.scandir entrega el tipo de entrada sin stat extra y el mtime se lee una vez por archivo
+    with os.scandir(HISTORIC_DIR) as entradas:
+        mtimes = {
+            Path(entrada.path): entrada.stat().st_mtime
+            for entrada in entradas
+            if entrada.name.endswith(".xlsx") and entrada.is_file()
+        }
+    # Ordenar por fecha de modificación (más antiguos primero)
+    archivos_historicos = sorted(mtimes, key=mtimes.get)
     
     total_archivos = len(archivos_historicos)
     
@@ -79,12 +97,10 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
         try:
             # Intentar leer con hoja "Programas" (nombre estándar)
             try:
-                from etl.exceptions_helpers import leer_excel_con_reintentos
                 df = leer_excel_con_reintentos(archivo_historico, sheet_name=HOJA_PROGRAMAS)
             except Exception:
                 # Si no tiene hoja "Programas", intentar leer la primera hoja
                 try:
-                    from etl.exceptions_helpers import leer_excel_con_reintentos
                     df = leer_excel_con_reintentos(archivo_historico, sheet_name=0)
                 except Exception as e:
                     print(f"[WARN] No se pudo leer {archivo_historico.name}: {e}")
@@ -100,8 +116,7 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
                 continue
             
             # Agregar columna con fecha del archivo (basada en nombre o fecha de modificación)
-            fecha_mod = archivo_historico.stat().st_mtime
-            import time
+            fecha_mod = mtimes[archivo_historico]
             fecha_str = time.strftime("%Y-%m-%d", time.localtime(fecha_mod))
             df["FECHA_ARCHIVO_HISTORICO"] = fecha_str
             df["ARCHIVO_ORIGEN"] = archivo_historico.name
@@ -123,20 +138,20 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
     # Consolidar todos los DataFrames
     print(f"Consolidando {len(registros_consolidados)} archivos...")
     df_consolidado = pd.concat(registros_consolidados, ignore_index=True)
+    # Los DataFrames por archivo ya no se usan: liberarlos antes de deduplicar
+    del registros_consolidados
     
     # Eliminar duplicados basados en CÓDIGO_SNIES_DEL_PROGRAMA (mantener el más reciente)
     # Si hay FECHA_ARCHIVO_HISTORICO, ordenar por fecha descendente
     if "FECHA_ARCHIVO_HISTORICO" in df_consolidado.columns:
         df_consolidado = df_consolidado.sort_values(
-            by="FECHA_ARCHIVO_HISTORICO", ascending=False, na_position="last"
+            by="FECHA_ARCHIVO_HISTORICO", ascending=False, na_position="last", kind="stable"
         )
     
     # Eliminar duplicados (mantener el primero, que es el más reciente)
     columnas_unicas = ["CÓDIGO_SNIES_DEL_PROGRAMA"]
     antes_dedup = len(df_consolidado)
-    df_consolidado = df_consolidado.drop_duplicates(
-        subset=columnas_unicas, keep="first"
-    )
+    df_consolidado = _primero_por_clave(df_consolidado, columnas_unicas)
     despues_dedup = len(df_consolidado)
     duplicados_eliminados = antes_dedup - despues_dedup
     
@@ -144,12 +159,9 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
         print(f"Eliminados {duplicados_eliminados} registros duplicados.")
     
     # Leer el histórico consolidado existente (si existe)
-    if ARCHIVO_HISTORICO.exists():
+    if existe_historico():
         try:
-            from etl.exceptions_helpers import leer_excel_con_reintentos
-            df_historico_existente = leer_excel_con_reintentos(
-                ARCHIVO_HISTORICO, sheet_name=HOJA_HISTORICO
-            )
+            df_historico_existente = leer_historico()
             print(f"Archivo histórico consolidado existente: {len(df_historico_existente)} registros")
             
             # Combinar con el histórico existente (evitar duplicados)
@@ -160,13 +172,11 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
             if "FECHA" in df_combinado.columns or "FECHA_ARCHIVO_HISTORICO" in df_combinado.columns:
                 col_fecha = "FECHA" if "FECHA" in df_combinado.columns else "FECHA_ARCHIVO_HISTORICO"
                 df_combinado = df_combinado.sort_values(
-                    by=col_fecha, ascending=False, na_position="last"
+                    by=col_fecha, ascending=False, na_position="last", kind="stable"
                 )
             
             antes_final = len(df_combinado)
-            df_final = df_combinado.drop_duplicates(
-                subset=columnas_unicas, keep="first"
-            )
+            df_final = _primero_por_clave(df_combinado, columnas_unicas)
             despues_final = len(df_final)
             
             print(f"Combinado con histórico existente. Total único: {despues_final} registros")
@@ -182,15 +192,7 @@ def consolidar_historicos(umbral: int = UMBRAL_CONSOLIDACION) -> tuple[int, int]
     # Guardar el histórico consolidado
     print(f"Guardando histórico consolidado: {ARCHIVO_HISTORICO}")
     try:
-        ARCHIVO_HISTORICO.parent.mkdir(parents=True, exist_ok=True)
-        with pd.ExcelWriter(
-            ARCHIVO_HISTORICO,
-            mode="w",
-            engine="openpyxl",
-        ) as writer:
-            df_final.to_excel(
-                writer, sheet_name=HOJA_HISTORICO, index=False
-            )
+        guardar_historico(df_final)
         print(f"✓ Histórico consolidado guardado: {len(df_final)} registros")
         log_info(f"Histórico consolidado guardado: {ARCHIVO_HISTORICO.name} ({len(df_final)} registros)")
     except Exception as e:
@@ -5,7 +5,9 @@ del archivo Programas.xlsx.
 
 from __future__ import annotations
 
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import pandas as pd
@@ -34,21 +36,122 @@ COLUMNAS_A_NORMALIZAR = [
     "MUNICIPIO_OFERTA_PROGRAMA",
 ]
 
+# A partir de estas filas las columnas se normalizan en hilos paralelos (por debajo, el
+# costo de repartir las columnas supera la ganancia)
+MIN_FILAS_NORMALIZACION_PARALELA = 20000
+
+
+# Patrones y tablas de traducción precompilados (limpiar_texto se llama por celda)
+_RE_ESPACIOS = re.compile(r"\s+")
+# Tras transliterar y pasar a minúsculas el texto es ASCII: todo lo que no sea [a-z0-9] ni
+# espacio se reemplaza por " " (equivale a re.sub(r"[^a-z0-9\s]", " ") con un solo translate)
+_TABLA_SIGNOS = str.maketrans({
+    chr(i): " "
+    for i in range(128)
+    if not (chr(i).isdigit() or chr(i).islower() or chr(i).isspace())
+})
+# Los mismos dos pasos como patrones de texto para las columnas string[pyarrow], donde
+# str.replace corre en el motor de expresiones de Arrow (no acepta re.Pattern ni translate).
+# Se listan explícitamente los espacios ASCII que reconoce str.isspace.
+_CLASE_ESPACIOS = "".join(f"\\x{i:02x}" for i in range(128) if chr(i).isspace())
+_PATRON_SIGNOS = f"[^a-z0-9{_CLASE_ESPACIOS}]"
+_PATRON_ESPACIOS = f"[{_CLASE_ESPACIOS}]+"
+# pyarrow es opcional: sin él, la limpieza usa columnas object
+try:
+    import pyarrow  # noqa: F401
+    _DTYPE_TEXTO_ARROW: str | None = "string[pyarrow]"
+except ImportError:
+    _DTYPE_TEXTO_ARROW = None
+# Diacríticos del español: evitan pasar por unidecode en el caso común
+_TABLA_TILDES = str.maketrans("áéíóúüñÁÉÍÓÚÜÑ", "aeiouunAEIOUUN")
+# Memo de unidecode para los textos que no resuelve la tabla (acotado en tamaño)
+_CACHE_UNIDECODE: dict[str, str] = {}
+_MAX_CACHE_UNIDECODE = 200_000
+
+
+def _quitar_tildes(texto: str) -> str:
+    """Translitera a ASCII: tabla de tildes primero y unidecode solo si queda algo no ASCII."""
+    texto = texto.translate(_TABLA_TILDES)
+    if texto.isascii():
+        return texto
+    # unidecode es puro Python: se memoiza por texto (los nombres se repiten entre filas/columnas)
+    resultado = _CACHE_UNIDECODE.get(texto)
+    if resultado is None:
+        if len(_CACHE_UNIDECODE) >= _MAX_CACHE_UNIDECODE:
+            _CACHE_UNIDECODE.clear()
+        resultado = _CACHE_UNIDECODE[texto] = unidecode(texto)
+    return resultado
+
 
 def limpiar_texto(valor: object) -> object:
     """Limpia texto eliminando tildes, signos y espacios extra."""
     if pd.isna(valor):
         return valor
 
-    texto = str(valor)
-    texto = unidecode(texto)
-    texto = texto.lower()
-    texto = re.sub(r"[^a-z0-9\s]", " ", texto)
-    texto = re.sub(r"\s+", " ", texto).strip()
+    texto = _quitar_tildes(str(valor))
+    texto = texto.lower().translate(_TABLA_SIGNOS)
+    texto = _RE_ESPACIOS.sub(" ", texto).strip()
 
     return texto
 
 
+def _limpiar_serie(serie: pd.Series) -> pd.Series:
+    """
+    Versión por columna de limpiar_texto: solo la transliteración recorre las celdas en Python;
+    minúsculas, signos y espacios se aplican con los métodos vectorizados de Series.str.
+    Los nulos se convierten en "".
+
+    En columnas de baja cardinalidad (departamento, nivel, estado...) se limpian solo los
+    valores distintos y el resultado se expande por código.
+    """
+    s = serie.fillna("").astype(str)
+    codigos, unicos = pd.factorize(s)
+    if len(unicos) * 4 < len(s):
+        limpios = _limpiar_textos(pd.Series(unicos, dtype=object)).to_numpy()
+        return pd.Series(limpios[codigos], index=s.index)
+    return _limpiar_textos(s)
+
+
+def _limpiar_textos(s: pd.Series) -> pd.Series:
+    """
+    Aplica la limpieza de limpiar_texto a una Series de str (sin nulos).
+
+    Con pyarrow, minúsculas, signos y espacios se aplican sobre string[pyarrow] (kernels de
+    Arrow, sin un objeto str por celda) y el resultado vuelve a object para no cambiar el
+    tipo de las columnas que reciben las etapas siguientes.
+    """
+    s = pd.Series([_quitar_tildes(x) if x else "" for x in s], index=s.index)
+    if _DTYPE_TEXTO_ARROW is not None:
+        s = s.astype(_DTYPE_TEXTO_ARROW).str.lower()
+        s = s.str.replace(_PATRON_SIGNOS, " ", regex=True).str.replace(_PATRON_ESPACIOS, " ", regex=True)
+        return s.str.strip().astype(object)
+    s = s.str.lower().str.translate(_TABLA_SIGNOS)
+    return s.str.replace(_RE_ESPACIOS, " ", regex=True).str.strip()
+
+
+def _normalizar_columnas_en_paralelo(df: pd.DataFrame, columnas: list[str]) -> dict[str, pd.Series]:
+    """
+    Normaliza las columnas (independientes entre sí) en paralelo.
+
+    Solo aplica con MIN_FILAS_NORMALIZACION_PARALELA filas o más, al menos 2 CPU y pyarrow
+    instalado. Se usa un pool de hilos: los pasos sobre string[pyarrow] corren en kernels de
+    Arrow que liberan el GIL. No se usan procesos: el pipeline corre en un hilo de la GUI y en
+    Windows cada subproceso vuelve a importar la aplicación y recibe las columnas serializadas,
+    lo que cuesta más que la limpieza. Si no aplica o el pool falla, devuelve {} y las
+    columnas se normalizan en secuencia.
+    """
+    trabajadores = min(len(columnas), os.cpu_count() or 1)
+    if len(df) < MIN_FILAS_NORMALIZACION_PARALELA or trabajadores < 2 or _DTYPE_TEXTO_ARROW is None:
+        return {}
+    try:
+        with ThreadPoolExecutor(max_workers=trabajadores) as executor:
+            futuros = {col: executor.submit(_limpiar_serie, df[col]) for col in columnas}
+            return {col: futuro.result() for col, futuro in futuros.items()}
+    except Exception as e:
+        log_warning(f"No se pudo normalizar en paralelo: {e}. Se normalizará en secuencia.")
+        return {}
+
+
 def normalizar_programas(df: pd.DataFrame | None = None, archivo: Path | None = None) -> pd.DataFrame:
     """
     Normaliza las columnas configuradas en la hoja Programas.
@@ -99,23 +202,14 @@ def normalizar_programas(df: pd.DataFrame | None = None, archivo: Path | None =
         print(f"Advertencia: {warning_msg}")
         log_info(f"Advertencia: {warning_msg}")
 
-    columnas_normalizadas = 0
-    for columna in COLUMNAS_A_NORMALIZAR:
-        if columna in df.columns:
-            try:
-                s = df[columna].fillna("").astype(str)
-                # List comprehension directa — más rápida que chunking con pd.concat
-                s = pd.Series([unidecode(x) if x else "" for x in s], index=s.index)
-                # Aplicar normalizaciones vectorizadas después de unidecode
-                s = s.str.lower().str.replace(r"[^a-z0-9\s]", " ", regex=True)
-                s = s.str.replace(r"\s+", " ", regex=True).str.strip()
-                df[columna] = s
-                columnas_normalizadas += 1
-            except Exception as e:
-                log_warning(f"Error al normalizar columna '{columna}': {e}. Continuando con las demás.")
-                continue
-
-    log_info(f"Columnas normalizadas: {columnas_normalizadas}")
+    columnas = [col for col in COLUMNAS_A_NORMALIZAR if col in df.columns]
+    resultados = _normalizar_columnas_en_paralelo(df, columnas)
+
+    # _limpiar_serie convierte todo a str antes de limpiar: no hay fallos esperables por columna
+    for columna in columnas:
+        df[columna] = resultados[columna] if columna in resultados else _limpiar_serie(df[columna])
+
+    log_info(f"Columnas normalizadas: {len(columnas)}")
 
     # Si se proporcionó df, solo retornar (sin escribir)
     if df is not None and archivo is None:
@@ -14,12 +14,15 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
 
 # Configurar sys.path para permitir ejecución directa del script
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+from etl.excel_io import reemplazar_hoja_excel
+from etl.exceptions_helpers import leer_excel_con_reintentos
 from etl.pipeline_logger import log_error, log_info
 from etl.config import (
     ARCHIVO_NORMALIZACION,
@@ -43,57 +46,76 @@ def cargar_mapeos_normalizacion() -> dict[str, dict[str, str]]:
         log_error(error_msg)
         raise FileNotFoundError(error_msg)
     
-    log_info(f"Cargando mapeos de normalización desde: {ARCHIVO_NORMALIZACION.name}")
+    log_info("Cargando mapeos de normalización desde: %s", ARCHIVO_NORMALIZACION.name)
     
-    # Leer todas las hojas del archivo
-    xls = pd.ExcelFile(ARCHIVO_NORMALIZACION)
+    # Recorrer todas las hojas con un solo libro abierto en modo read_only: solo se necesitan
+    # las dos primeras columnas de cada hoja, sin construir DataFrames
+    wb = load_workbook(ARCHIVO_NORMALIZACION, read_only=True, data_only=True)
     mapeos = {}
+    try:
+        for hoja in wb.sheetnames:
+            filas = wb[hoja].iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            registros = [fila for fila in filas if any(valor is not None for valor in fila)]
+            
+            if encabezado is None or not registros:
+                log_info("Hoja '%s' está vacía, omitiendo", hoja)
+                continue
+            
+            # Obtener nombres de columnas (primera fila es encabezado)
+            if max(len(encabezado), *(len(fila) for fila in registros)) < 2:
+                log_error("Hoja '%s' debe tener al menos 2 columnas", hoja)
+                continue
+            
+            # Crear diccionario de mapeo omitiendo filas con valor actual o normalizado nulo
+            mapeo = {
+                str(fila[0]).strip(): str(fila[1]).strip()
+                for fila in registros
+                if len(fila) >= 2 and fila[0] is not None and fila[1] is not None
+            }
+            
+            if mapeo:
+                mapeos[hoja] = mapeo
+                log_info("Cargados %d mapeos para la columna '%s'", len(mapeo), hoja)
+            else:
+                log_info("No se encontraron mapeos válidos para la columna '%s'", hoja)
+    finally:
+        wb.close()
     
-    for hoja in xls.sheet_names:
-        df_hoja = pd.read_excel(ARCHIVO_NORMALIZACION, sheet_name=hoja)
-        
-        if df_hoja.empty:
-            log_info(f"Hoja '{hoja}' está vacía, omitiendo")
-            continue
-        
-        # Obtener nombres de columnas (primera fila es encabezado)
-        if len(df_hoja.columns) < 2:
-            log_error(f"Hoja '{hoja}' debe tener al menos 2 columnas")
-            continue
-        
-        col_actual = df_hoja.columns[0]
-        col_normalizada = df_hoja.columns[1]
-        
-        # Crear diccionario de mapeo usando operaciones vectorizadas (optimizado)
-        # Filtrar filas con valores nulos en col_actual
-        mask_validos = df_hoja[col_actual].notna()
-        df_validos = df_hoja.loc[mask_validos]
-        
-        if df_validos.empty:
-            continue
-        
-        # Convertir a string y limpiar espacios usando operaciones vectorizadas
-        claves = df_validos[col_actual].astype(str).str.strip()
-        valores = df_validos[col_normalizada]
-        
-        # Filtrar valores normalizados no nulos y crear diccionario
-        mask_valores_validos = valores.notna()
-        claves_validas = claves[mask_valores_validos]
-        valores_validos = valores[mask_valores_validos].astype(str).str.strip()
-        
-        # Crear diccionario directamente desde Series (más eficiente)
-        mapeo = dict(zip(claves_validas, valores_validos))
-        
-        if mapeo:
-            mapeos[hoja] = mapeo
-            log_info(f"Cargados {len(mapeo)} mapeos para la columna '{hoja}'")
-        else:
-            log_info(f"No se encontraron mapeos válidos para la columna '{hoja}'")
-    
-    log_info(f"Total de columnas con mapeos: {len(mapeos)}")
+    log_info("Total de columnas con mapeos: %d", len(mapeos))
     return mapeos
 
 
+def _reemplazar_por_mapeo(
+    valores: pd.Series,
+    claves: pd.Series,
+    mapeo: dict[str, str],
+    quitar_sufijo_decimal: bool = False,
+) -> np.ndarray:
+    """
+    Devuelve una copia de valores con mapeo[clave] en las filas cuya clave (como texto, sin
+    espacios) está en el mapeo; el resto, incluidas las filas con clave nula, conserva su valor.
+
+    La conversión a texto y la búsqueda se hacen una vez por clave distinta (las columnas
+    mapeadas tienen pocos valores distintos) y se expanden a las filas por código.
+
+    Args:
+        valores: Columna a normalizar
+        claves: Columna con las claves del mapeo (la misma columna o el código de institución)
+        mapeo: Diccionario {valor_actual: valor_normalizado}
+        quitar_sufijo_decimal: Quitar ".0" de las claves (códigos leídos como float)
+    """
+    codigos, unicos = pd.factorize(claves)
+    claves_unicas = pd.Series(unicos, dtype=object).astype(str).str.strip()
+    if quitar_sufijo_decimal:
+        claves_unicas = claves_unicas.str.removesuffix(".0")
+    # Se agrega un elemento al final para que el código -1 (clave nula) no tenga mapeo
+    mapeados = np.append(claves_unicas.map(mapeo).to_numpy(dtype=object), None)[codigos]
+    resultado = valores.to_numpy(dtype=object, copy=True)
+    np.copyto(resultado, mapeados, where=pd.notna(mapeados))
+    return resultado
+
+
 def aplicar_normalizacion_final(df: pd.DataFrame | None = None, archivo: Path | None = None) -> pd.DataFrame:
     """
     Aplica la normalización final de ortografía y formato al archivo Programas.xlsx.
@@ -121,7 +143,7 @@ def aplicar_normalizacion_final(df: pd.DataFrame | None = None, archivo: Path |
             raise FileNotFoundError(error_msg)
         
         log_info(f"Cargando archivo: {archivo.name}")
-        df = pd.read_excel(archivo, sheet_name=HOJA_PROGRAMAS)
+        df = leer_excel_con_reintentos(archivo, sheet_name=HOJA_PROGRAMAS)
         log_info(f"Archivo cargado: {len(df)} filas, {len(df.columns)} columnas")
     
     # Cargar mapeos
@@ -133,10 +155,10 @@ def aplicar_normalizacion_final(df: pd.DataFrame | None = None, archivo: Path |
     # Aplicar mapeos a cada columna (optimizado para memoria)
     for nombre_columna, mapeo in mapeos.items():
         if nombre_columna not in df.columns:
-            log_info(f"Columna '{nombre_columna}' no encontrada en el archivo, omitiendo")
+            log_info("Columna '%s' no encontrada en el archivo, omitiendo", nombre_columna)
             continue
         
-        log_info(f"Procesando columna: {nombre_columna}")
+        log_info("Procesando columna: %s", nombre_columna)
         
         # Caso especial: NOMBRE_INSTITUCIÓN usa CÓDIGO_INSTITUCIÓN_PADRE
         if nombre_columna == HOJA_ESPECIAL_INSTITUCION:
@@ -152,50 +174,31 @@ def aplicar_normalizacion_final(df: pd.DataFrame | None = None, archivo: Path |
             # Guardar referencia a columna original antes de modificar (para conteo)
             columna_original = df[nombre_columna]
             # Aplicar mapeo usando el código de institución padre
-            valores_mapeados = (
-                df[COLUMNA_ID_INSTITUCION].astype(str).str.strip().map(mapeo)
+            # (sin sufijo ".0": la columna puede venir como float si tiene vacíos; las claves
+            # del archivo de normalización se leen como enteros)
+            df[nombre_columna] = _reemplazar_por_mapeo(
+                columna_original, df[COLUMNA_ID_INSTITUCION], mapeo, quitar_sufijo_decimal=True
             )
-            # Mantener valores originales donde no hay mapeo (eficiente con fillna)
-            df[nombre_columna] = valores_mapeados.fillna(columna_original)
-            log_info(f"  -> Usando columna '{COLUMNA_ID_INSTITUCION}' para mapeo por ID")
+            log_info("  -> Usando columna '%s' para mapeo por ID", COLUMNA_ID_INSTITUCION)
             
         else:
             # Para las demás columnas, mapear el texto directamente.
             # IMPORTANTE: aplicar el mapeo SOLO sobre valores no nulos para evitar
             # que NaN se convierta en la cadena "nan" y cause cruces fantasma.
             columna_original = df[nombre_columna]
-            mask_nan_original = columna_original.isna()
-
-            serie_no_nula = columna_original[~mask_nan_original].astype(str).str.strip()
-            valores_mapeados = serie_no_nula.map(mapeo)
-
-            df[nombre_columna] = columna_original.copy()
-            mask_mapeado = valores_mapeados.notna()
-            if mask_mapeado.any():
-                df.loc[valores_mapeados[mask_mapeado].index, nombre_columna] = valores_mapeados[mask_mapeado]
-
-            if mask_nan_original.any():
-                df.loc[mask_nan_original, nombre_columna] = np.nan
-        
-        # Contar reemplazos de forma optimizada (común para ambos casos)
-        # Comparar solo donde ambos tienen valores (evita comparaciones innecesarias)
-        mask_ambos_valores = columna_original.notna() & df[nombre_columna].notna()
-        if mask_ambos_valores.any():
-            cambios_valores = (
-                columna_original[mask_ambos_valores] != df[nombre_columna][mask_ambos_valores]
-            ).sum()
-        else:
-            cambios_valores = 0
+            df[nombre_columna] = _reemplazar_por_mapeo(columna_original, columna_original, mapeo)
         
-        # Contar cambios de NaN a valor o viceversa
-        cambios_na = (columna_original.isna() != df[nombre_columna].isna()).sum()
-        reemplazos = cambios_valores + cambios_na
+        # Contar reemplazos en una sola pasada: celdas cuyo valor cambió, sin contar las que
+        # eran y siguen siendo nulas (NaN != NaN)
+        originales = columna_original.to_numpy(dtype=object)
+        nuevos = df[nombre_columna].to_numpy(dtype=object)
+        reemplazos = int(((originales != nuevos) & ~(pd.isna(originales) & pd.isna(nuevos))).sum())
         
         total_reemplazos += reemplazos
         columnas_procesadas += 1
         
         if reemplazos > 0:
-            log_info(f"  -> {reemplazos} valores normalizados en '{nombre_columna}'")
+            log_info("  -> %d valores normalizados en '%s'", reemplazos, nombre_columna)
     
     log_info(f"Total de columnas procesadas: {columnas_procesadas}")
     log_info(f"Total de valores reemplazados: {total_reemplazos}")
@@ -209,13 +212,7 @@ def aplicar_normalizacion_final(df: pd.DataFrame | None = None, archivo: Path |
     archivo = archivo or ARCHIVO_PROGRAMAS
     log_info(f"Guardando archivo actualizado: {archivo.name}")
     try:
-        with pd.ExcelWriter(
-            archivo,
-            mode="a",
-            if_sheet_exists="replace",
-            engine="openpyxl",
-        ) as writer:
-            df.to_excel(writer, sheet_name=HOJA_PROGRAMAS, index=False)
+        reemplazar_hoja_excel(archivo, df, sheet_name=HOJA_PROGRAMAS)
         log_info(f"Normalización final completada: {archivo.name}")
     except PermissionError as e:
         from etl.exceptions_helpers import explicar_error_archivo_abierto
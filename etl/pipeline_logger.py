@@ -11,6 +11,7 @@ from __future__ import annotations
 
 import logging
 import logging.handlers
+import os
 from pathlib import Path
 
 from etl.config import LOGS_DIR, LOG_LEVEL, LOG_MAX_BYTES
@@ -21,6 +22,47 @@ LOG_FILE.parent.mkdir(exist_ok=True)
 # Logger con rotación por tamaño (evita que el archivo crezca sin límite)
 _LOGGER: logging.Logger | None = None
 _BACKUP_COUNT = 3
+# Segundos máximos que un mensaje INFO/DEBUG puede quedar en el búfer: si la GUI se cierra a la
+# fuerza o el proceso muere, se pierde a lo sumo ese intervalo del log
+_INTERVALO_VACIADO_SEGUNDOS = 2.0
+
+
+class _ManejadorRotativoEnBufer(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler que no vacía el archivo en cada mensaje.
+
+    El handler estándar, por cada registro, consulta el archivo en disco (exists/isfile),
+    hace seek/tell para decidir la rotación y llama a flush. Aquí el tamaño se lleva en un
+    contador y el búfer se vacía con WARNING o superior, cuando el último vaciado tiene más de
+    _INTERVALO_VACIADO_SEGUNDOS, al rotar o al cerrar (logging.shutdown lo hace al salir del
+    proceso).
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._bytes_escritos = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        self._ultimo_vaciado = 0.0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            mensaje = self.format(record) + self.terminator
+            # maxBytes se compara con bytes en disco, no con caracteres (tildes y ñ ocupan 2 en UTF-8)
+            tamano = len(mensaje.encode(self.encoding or "utf-8", errors=self.errors or "strict"))
+            if self.maxBytes > 0 and self._bytes_escritos > 0 and self._bytes_escritos + tamano >= self.maxBytes:
+                self.doRollover()
+                self._bytes_escritos = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(mensaje)
+            self._bytes_escritos += tamano
+            # record.created ya trae la hora del mensaje: no hace falta consultar el reloj
+            if record.levelno >= logging.WARNING or record.created - self._ultimo_vaciado >= _INTERVALO_VACIADO_SEGUNDOS:
+                self.stream.flush()
+                self._ultimo_vaciado = record.created
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
 
 
 def _get_logger() -> logging.Logger:
@@ -28,7 +70,7 @@ def _get_logger() -> logging.Logger:
     if _LOGGER is None:
         _LOGGER = logging.getLogger("pipeline_snies")
         _LOGGER.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
-        handler = logging.handlers.RotatingFileHandler(
+        handler = _ManejadorRotativoEnBufer(
             LOG_FILE,
             maxBytes=LOG_MAX_BYTES,
             backupCount=_BACKUP_COUNT,
@@ -42,6 +84,13 @@ def _get_logger() -> logging.Logger:
     return _LOGGER
 
 
+def vaciar_log() -> None:
+    """Escribe en disco los mensajes pendientes en el búfer (p. ej. antes de abrir el log)."""
+    if _LOGGER is not None:
+        for handler in _LOGGER.handlers:
+            handler.flush()
+
+
 def log_inicio() -> None:
     """Registra el inicio de ejecución del pipeline."""
     _get_logger().info("INICIO: ejecución del pipeline.")
@@ -62,6 +111,7 @@ def log_fin(duracion_minutos: float | None = None) -> None:
         _get_logger().info("FIN: ejecución completa (duración: %s).", duracion_str)
     else:
         _get_logger().info("FIN: ejecución completa.")
+    vaciar_log()
 
 
 def log_etapa_iniciada(nombre_etapa: str) -> None:
@@ -77,24 +127,43 @@ def log_etapa_completada(nombre_etapa: str, detalles: str | None = None) -> None
         _get_logger().info("%s finalizada.", nombre_etapa)
 
 
-def log_error(mensaje_error: str) -> None:
+def _registrar(nivel: int, mensaje: str, args: tuple) -> None:
+    """
+    Registra mensaje con el nivel dado. Con args, se formatea con % (mensaje % args) solo si
+    el nivel está habilitado; sin args, el mensaje se escribe tal cual (puede contener %).
+    """
+    logger = _get_logger()
+    if logger.isEnabledFor(nivel):
+        if args:
+            logger.log(nivel, mensaje, *args)
+        else:
+            logger.log(nivel, "%s", mensaje)
+
+
+def log_error(mensaje_error: str, *args: object) -> None:
     """Registra un error."""
-    _get_logger().error("%s", mensaje_error)
+    _registrar(logging.ERROR, mensaje_error, args)
 
 
-def log_warning(mensaje_warning: str) -> None:
+def log_warning(mensaje_warning: str, *args: object) -> None:
     """Registra una advertencia."""
-    _get_logger().warning("%s", mensaje_warning)
+    _registrar(logging.WARNING, mensaje_warning, args)
+
 
+def log_info(mensaje_info: str, *args: object) -> None:
+    """
+    Registra información general.
 
-def log_info(mensaje_info: str) -> None:
-    """Registra información general."""
-    _get_logger().info("%s", mensaje_info)
+    En llamadas frecuentes (por columna o por hoja) conviene pasar formato y argumentos,
+    p. ej. log_info("Procesando columna: %s", columna), para no construir el texto si
+    el nivel configurado descarta INFO.
+    """
+    _registrar(logging.INFO, mensaje_info, args)
 
 
-def log_resultado(mensaje_resultado: str) -> None:
+def log_resultado(mensaje_resultado: str, *args: object) -> None:
     """Registra un resultado o KPI."""
-    _get_logger().info("%s", mensaje_resultado)
+    _registrar(logging.INFO, mensaje_resultado, args)
 
 
 def log_exception(exc: BaseException) -> None:
@@ -6,13 +6,17 @@ y marcar los programas nuevos mediante la columna CÓDIGO_SNIES_DEL_PROGRAMA.
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from etl.pipeline_logger import log_error, log_info, log_resultado, log_warning
 from etl.config import ARCHIVO_PROGRAMAS, HISTORIC_DIR, HOJA_PROGRAMAS
+from etl.excel_io import leer_columna_streaming
 from etl.exceptions_helpers import (
+    MOTOR_LECTURA_EXCEL,
     leer_excel_con_reintentos,
     escribir_excel_con_reintentos,
     validar_excel_basico,
@@ -21,6 +25,91 @@ from etl.exceptions_helpers import (
 
 COLUMNA_ID = "CÓDIGO_SNIES_DEL_PROGRAMA"
 COLUMNA_NUEVO = "PROGRAMA_NUEVO"
+# Textos que resultan de convertir nulos a str y no son códigos SNIES válidos
+CODIGOS_VACIOS = frozenset({"", "NAN", "NONE", "NULL"})
+
+
+def _normalizar_codigos(codigos: pd.Series) -> pd.Series:
+    """
+    Normaliza códigos SNIES para compararlos: str, sin espacios, en mayúsculas y sin el
+    sufijo ".0" que deja Excel en los códigos leídos como float. Los nulos quedan como "".
+
+    Los tres pasos se aplican en una sola pasada por código: encadenar .str.strip(),
+    .str.upper() y .str.removesuffix() crea un arreglo intermedio por paso.
+    """
+    return pd.Series(
+        [str(codigo).strip().upper().removesuffix(".0") for codigo in codigos.fillna("").to_numpy()],
+        index=codigos.index,
+        dtype=object,
+    )
+
+
+def _codigos_enteros(codigos: pd.Series) -> np.ndarray | None:
+    """
+    Devuelve los códigos no nulos como int64 si todos son enteros (p. ej. 101, 101.0 o " 101 ").
+
+    Si alguno no es numérico o tiene decimales, devuelve None: esos códigos se comparan
+    como texto con _normalizar_codigos.
+    """
+    codigos = codigos.dropna()
+    if pd.api.types.is_integer_dtype(codigos):
+        return codigos.to_numpy(dtype=np.int64)
+    numericos = pd.to_numeric(codigos, errors="coerce")
+    if numericos.isna().any() or not (numericos % 1 == 0).all():
+        return None
+    return numericos.to_numpy(dtype=np.int64)
+
+
+def _leer_ids_historico(archivo_historico: Path) -> pd.DataFrame:
+    """
+    Lee la columna de códigos SNIES del archivo histórico.
+
+    Del histórico solo se usa la columna de ID, así que no se parsean las demás. El resultado
+    se guarda en una caché Parquet en TEMP_DIR cuyo nombre incluye mtime y tamaño del .xlsx:
+    mientras el histórico no cambie, las siguientes ejecuciones no vuelven a abrir el Excel.
+
+    Returns:
+        DataFrame con la columna COLUMNA_ID, o vacío si el histórico no la tiene
+    """
+    from etl.config import TEMP_DIR
+
+    estado = archivo_historico.stat()
+    prefijo_cache = f"ids_{archivo_historico.stem}_"
+    ruta_cache = TEMP_DIR / f"{prefijo_cache}{estado.st_mtime_ns}_{estado.st_size}.parquet"
+    if ruta_cache.exists():
+        try:
+            return pd.read_parquet(ruta_cache)
+        except Exception as e:
+            log_warning(f"No se pudo leer la caché de códigos históricos ({ruta_cache.name}): {e}")
+
+    # Con un callable (en vez de usecols=[COLUMNA_ID]) un histórico sin esa columna da un
+    # DataFrame vacío en lugar de un error, y cae en la rama "histórico sin columna de ID"
+    # Los códigos se normalizan como texto al comparar (sin sufijo ".0"): que calamine los lea
+    # como float no cambia el resultado
+    if MOTOR_LECTURA_EXCEL == "calamine":
+        df_ids = leer_excel_con_reintentos(
+            archivo_historico,
+            sheet_name=HOJA_PROGRAMAS,
+            usecols=lambda col: col == COLUMNA_ID,
+            engine=MOTOR_LECTURA_EXCEL,
+        )
+    else:
+        # Con openpyxl, pd.read_excel convierte todas las celdas aunque se indique usecols:
+        # se recorre solo la columna de ID en modo read_only
+        df_ids = leer_columna_streaming(archivo_historico, HOJA_PROGRAMAS, COLUMNA_ID)
+
+    if COLUMNA_ID in df_ids.columns:
+        try:
+            for anterior in TEMP_DIR.glob(f"{prefijo_cache}*.parquet"):
+                anterior.unlink(missing_ok=True)
+            codigos = df_ids[COLUMNA_ID]
+            if codigos.dtype == object:
+                # Parquet no admite columnas con tipos mezclados (enteros y texto)
+                codigos = codigos.where(codigos.isna(), codigos.astype(str))
+            codigos.to_frame().to_parquet(ruta_cache, index=False)
+        except Exception as e:
+            log_warning(f"No se pudo guardar la caché de códigos históricos: {e}")
+    return df_ids
 
 
 def obtener_ultimo_archivo_historico(directorio: Path) -> Path | None:
@@ -37,19 +126,53 @@ def obtener_ultimo_archivo_historico(directorio: Path) -> Path | None:
     if not directorio.exists():
         return None
     
-    archivos_xlsx = list(directorio.glob("*.xlsx"))
-    if not archivos_xlsx:
+    # Una pasada con os.scandir (el mtime de cada entrada se consulta una sola vez) y max()
+    # en lugar de ordenar todos los archivos para quedarse con el primero
+    candidatos = (
+        (entrada.stat().st_mtime, entrada.path)
+        for entrada in os.scandir(directorio)
+        if entrada.name.lower().endswith(".xlsx")
+        and not entrada.name.startswith("~$")  # temporales de Excel
+        and entrada.is_file()
+    )
+    ultimo = max(candidatos, key=lambda candidato: candidato[0], default=None)
+    return Path(ultimo[1]) if ultimo is not None else None
+
+
+def _cargar_historico_para_comparar(archivo_historico: Path | None) -> pd.DataFrame | None:
+    """
+    Lee la columna de códigos del último histórico para compararla con el archivo actual.
+
+    Devuelve None (y registra el motivo) cuando no hay histórico con el que comparar: no
+    existe, no es válido, está abierto, no tiene la columna de ID o no tiene códigos. En
+    ese caso todos los programas se marcan como nuevos.
+    """
+    if archivo_historico is None:
+        log_resultado("Sin archivo histórico: todos los programas se marcan como nuevos")
         return None
-    
-    # Filtrar archivos temporales de Excel (que empiezan con ~$)
-    archivos_xlsx = [f for f in archivos_xlsx if not f.name.startswith("~$")]
-    
-    if not archivos_xlsx:
+
+    print(f"Leyendo archivo histórico: {archivo_historico.name}")
+    log_info("Archivo histórico: %s", archivo_historico)
+    # Validar y leer el archivo histórico con manejo robusto
+    es_valido_hist, msg_error_hist = validar_excel_basico(archivo_historico)
+    if not es_valido_hist:
+        log_warning(f"El archivo histórico {archivo_historico.name} no es válido: {msg_error_hist}")
+        log_warning("Marcando todos los programas como nuevos (sin histórico válido).")
         return None
-    
-    # Ordenar por fecha de modificación (más reciente primero)
-    archivos_xlsx.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-    return archivos_xlsx[0]
+
+    try:
+        df_historico = _leer_ids_historico(archivo_historico)
+    except PermissionError:
+        log_warning(f"El archivo histórico {archivo_historico.name} está abierto. Marcando todos como nuevos.")
+        return None
+
+    if COLUMNA_ID not in df_historico.columns:
+        log_resultado("Histórico sin columna de ID: todos los programas se marcan como nuevos")
+        return None
+    if not df_historico[COLUMNA_ID].notna().any():
+        log_resultado("Histórico sin códigos SNIES: todos los programas se marcan como nuevos")
+        return None
+    return df_historico
 
 
 def procesar_programas_nuevos(df: pd.DataFrame | None = None, archivo: Path | None = None) -> pd.DataFrame:
@@ -67,9 +190,13 @@ def procesar_programas_nuevos(df: pd.DataFrame | None = None, archivo: Path | No
     Si df es None, lee desde archivo y escribe de vuelta.
     Si df se proporciona, solo procesa y retorna (sin I/O).
     """
+    futuro_historico = None
     # Si se proporciona DataFrame, trabajar en memoria
     if df is not None:
-        df_actual = df.copy()
+        # Copia superficial: aquí solo se filtran filas, se quitan columnas y se asigna
+        # PROGRAMA_NUEVO completa (df[col] = ... reemplaza el arreglo, no lo escribe en sitio),
+        # así que el DataFrame de quien llama no se modifica y no se duplican sus datos
+        df_actual = df.copy(deep=False)
         log_info(f"Procesando DataFrame en memoria ({len(df_actual)} filas)")
     else:
         # Modo tradicional: leer desde archivo
@@ -86,20 +213,19 @@ def procesar_programas_nuevos(df: pd.DataFrame | None = None, archivo: Path | No
             log_error(f"Validación fallida del archivo actual: {msg_error}")
             raise ValueError(msg_error)
         
-        try:
-            df_actual = leer_excel_con_reintentos(archivo, sheet_name=HOJA_PROGRAMAS)
-            log_info(f"Archivo actual cargado: {archivo.name}")
-        except PermissionError as e:
-            error_msg = explicar_error_archivo_abierto(archivo, "leer")
-            log_error(error_msg)
-            raise PermissionError(error_msg) from e
-    
-    # Eliminar filas vacías (donde todas las columnas son nulas)
-    filas_antes = len(df_actual)
-    df_actual = df_actual.dropna(how='all')
-    filas_despues = len(df_actual)
-    if filas_antes != filas_despues:
-        print(f"Se eliminaron {filas_antes - filas_despues} filas vacías del archivo actual.")
+        # Los códigos del histórico se leen en un hilo mientras se lee el archivo actual: son
+        # lecturas independientes y parte del costo es E/S y descompresión, que liberan el GIL
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            futuro_historico = executor.submit(
+                _cargar_historico_para_comparar, obtener_ultimo_archivo_historico(HISTORIC_DIR)
+            )
+            try:
+                df_actual = leer_excel_con_reintentos(archivo, sheet_name=HOJA_PROGRAMAS)
+                log_info(f"Archivo actual cargado: {archivo.name}")
+            except PermissionError as e:
+                error_msg = explicar_error_archivo_abierto(archivo, "leer")
+                log_error(error_msg)
+                raise PermissionError(error_msg) from e
     
     # Verificar que existe la columna de ID
     if COLUMNA_ID not in df_actual.columns:
@@ -107,15 +233,21 @@ def procesar_programas_nuevos(df: pd.DataFrame | None = None, archivo: Path | No
             f"No se encontró la columna '{COLUMNA_ID}' en el archivo actual"
         )
     
-    # Eliminar filas donde CÓDIGO_SNIES_DEL_PROGRAMA está vacío (incluye notas y filas sin código)
-    filas_antes_codigo = len(df_actual)
-    df_actual = df_actual.dropna(subset=[COLUMNA_ID])
-    filas_despues_codigo = len(df_actual)
-    if filas_antes_codigo != filas_despues_codigo:
-        print(
-            f"Se eliminaron {filas_antes_codigo - filas_despues_codigo} filas sin código SNIES "
-            "(incluyendo notas y filas vacías en la columna de identificación)."
-        )
+    # Eliminar filas sin CÓDIGO_SNIES_DEL_PROGRAMA con un solo filtro: incluye las filas
+    # vacías (todas las columnas nulas), notas y filas sin código. Solo para el mensaje se
+    # distinguen las vacías, revisando únicamente las filas descartadas.
+    mask_con_codigo = df_actual[COLUMNA_ID].notna()
+    if not mask_con_codigo.all():
+        sin_codigo = df_actual.loc[~mask_con_codigo]
+        filas_vacias = int(sin_codigo.isna().all(axis=1).sum())
+        if filas_vacias:
+            print(f"Se eliminaron {filas_vacias} filas vacías del archivo actual.")
+        if len(sin_codigo) > filas_vacias:
+            print(
+                f"Se eliminaron {len(sin_codigo) - filas_vacias} filas sin código SNIES "
+                "(incluyendo notas y filas vacías en la columna de identificación)."
+            )
+        df_actual = df_actual.loc[mask_con_codigo]
 
     # No crear ni mantener columnas deprecadas (FUENTE_DATOS, MATCH_SCORE, COINCIDE_HISTORICO, REQUIERE_VALIDACION)
     columnas_deprecadas = ["FUENTE_DATOS", "MATCH_SCORE", "COINCIDE_HISTORICO", "REQUIERE_VALIDACION"]
@@ -123,154 +255,65 @@ def procesar_programas_nuevos(df: pd.DataFrame | None = None, archivo: Path | No
     if presentes:
         df_actual = df_actual.drop(columns=presentes)
 
-    # OPTIMIZACIÓN: Normalizar código usando operaciones vectorizadas en lugar de .apply()
-    # Normalizar: convertir a string, eliminar espacios, mayúsculas, y quitar .0 de números
-    codigos_str = df_actual[COLUMNA_ID].fillna("").astype(str)
-    codigos_normalizados = codigos_str.str.strip().str.upper()
-    # Remover .0 al final usando operación vectorizada
-    codigos_normalizados = codigos_normalizados.str.replace(r'\.0$', '', regex=True)
-    df_actual['_codigo_normalizado'] = codigos_normalizados
- 
-    # Obtener el último archivo histórico
-    archivo_historico = obtener_ultimo_archivo_historico(HISTORIC_DIR)
+    # Obtener el último archivo histórico y sus códigos (None si no hay con qué comparar;
+    # en memoria, sin programas en el archivo actual no se lee)
+    df_historico = None
+    if futuro_historico is not None:
+        df_historico = futuro_historico.result()
+    elif len(df_actual) > 0:
+        archivo_historico = obtener_ultimo_archivo_historico(HISTORIC_DIR)
+        df_historico = _cargar_historico_para_comparar(archivo_historico)
 
-    if archivo_historico is None:
-        df_actual[COLUMNA_NUEVO] = "Sí"
-        df_actual = df_actual.drop(columns=['_codigo_normalizado'])
-
-        total = len(df_actual)
-        log_resultado(f"Filas procesadas: {total} (sin histórico)")
-        # Modo memoria: el pipeline escribe después; retornar DataFrame
-        if df is not None:
-            return df_actual
-        print(f"Guardando archivo actualizado: {ARCHIVO_PROGRAMAS}")
-        try:
-            escribir_excel_con_reintentos(ARCHIVO_PROGRAMAS, df_actual, sheet_name=HOJA_PROGRAMAS)
-            log_info(f"Archivo actualizado guardado: {ARCHIVO_PROGRAMAS.name}")
-            print("Procesamiento completado exitosamente.")
-        except PermissionError as e:
-            error_msg = explicar_error_archivo_abierto(ARCHIVO_PROGRAMAS, "escribir")
-            log_error(error_msg)
-            raise PermissionError(error_msg) from e
-        return df_actual
-    
-    print(f"Leyendo archivo histórico: {archivo_historico.name}")
-    print(f"Ruta completa: {archivo_historico}")
-    log_info(f"Archivo histórico cargado: {archivo_historico.name}")
-    # Validar y leer el archivo histórico con manejo robusto
-    es_valido_hist, msg_error_hist = validar_excel_basico(archivo_historico)
-    if not es_valido_hist:
-        log_warning(f"El archivo histórico {archivo_historico.name} no es válido: {msg_error_hist}")
-        log_warning("Marcando todos los programas como nuevos (sin histórico válido).")
-        df_actual[COLUMNA_NUEVO] = "Sí"
-        df_actual = df_actual.drop(columns=['_codigo_normalizado'])
-        if df is not None:
-            return df_actual
-        try:
-            escribir_excel_con_reintentos(ARCHIVO_PROGRAMAS, df_actual, sheet_name=HOJA_PROGRAMAS)
-            log_info(f"Archivo actualizado guardado: {ARCHIVO_PROGRAMAS.name}")
-        except PermissionError as e:
-            error_msg = explicar_error_archivo_abierto(ARCHIVO_PROGRAMAS, "escribir")
-            log_error(error_msg)
-            raise PermissionError(error_msg) from e
-        return df_actual
-    
-    try:
-        df_historico = leer_excel_con_reintentos(archivo_historico, sheet_name=HOJA_PROGRAMAS)
-    except PermissionError:
-        log_warning(f"El archivo histórico {archivo_historico.name} está abierto. Marcando todos como nuevos.")
-        df_actual[COLUMNA_NUEVO] = "Sí"
-        df_actual = df_actual.drop(columns=['_codigo_normalizado'])
-        if df is not None:
-            return df_actual
-        try:
-            escribir_excel_con_reintentos(ARCHIVO_PROGRAMAS, df_actual, sheet_name=HOJA_PROGRAMAS)
-            log_info(f"Archivo actualizado guardado: {ARCHIVO_PROGRAMAS.name}")
-        except PermissionError as e:
-            error_msg = explicar_error_archivo_abierto(ARCHIVO_PROGRAMAS, "escribir")
-            log_error(error_msg)
-            raise PermissionError(error_msg) from e
-        return df_actual
-    
-    # Eliminar filas vacías (donde todas las columnas son nulas)
-    filas_antes_hist = len(df_historico)
-    df_historico = df_historico.dropna(how='all')
-    filas_despues_hist = len(df_historico)
-    if filas_antes_hist != filas_despues_hist:
-        print(f"Se eliminaron {filas_antes_hist - filas_despues_hist} filas vacías del archivo histórico.")
-    
-    # Verificar que existe la columna de ID en el histórico
-    if COLUMNA_ID not in df_historico.columns:
+    if df_historico is None:
+        # Sin histórico utilizable no hace falta normalizar ni buscar códigos
         df_actual[COLUMNA_NUEVO] = "Sí"
-        df_actual = df_actual.drop(columns=['_codigo_normalizado'])
+    else:
+        # Si los códigos de ambos archivos son enteros (el caso habitual), se comparan como int64;
+        # si alguno tiene códigos alfanuméricos, se comparan como texto normalizado.
+        # Solo se usa la columna de ID: las filas vacías o sin código se descartan aquí, sin
+        # dropna previos sobre el DataFrame completo.
+        codigos_hist_enteros = _codigos_enteros(df_historico[COLUMNA_ID])
+        codigos_act_enteros = (
+            _codigos_enteros(df_actual[COLUMNA_ID]) if codigos_hist_enteros is not None else None
+        )
+        if codigos_act_enteros is not None:
+            ids_historicos = np.unique(codigos_hist_enteros)
+            ejemplos_historicos = ids_historicos[:5].tolist()
+            mask_nuevo = ~np.isin(codigos_act_enteros, ids_historicos)
+        else:
+            ids_historicos_norm = _normalizar_codigos(df_historico[COLUMNA_ID])
+            ids_historicos = frozenset(ids_historicos_norm[~ids_historicos_norm.isin(CODIGOS_VACIOS)])
+            ejemplos_historicos = list(ids_historicos)[:5]
+            # Un programa es nuevo si su código es válido y no aparece en el histórico
+            # (búsqueda directa en los frozenset: Series.isin convertiría el conjunto histórico a
+            # arreglo y lo volvería a indexar en cada llamada)
+            codigos_norm = _normalizar_codigos(df_actual[COLUMNA_ID]).to_numpy()
+            mask_nuevo = np.fromiter(
+                (codigo not in CODIGOS_VACIOS and codigo not in ids_historicos for codigo in codigos_norm),
+                dtype=bool,
+                count=len(codigos_norm),
+            )
 
-        total = len(df_actual)
-        log_resultado(f"Filas procesadas: {total} (histórico sin columna de ID)")
-        
-        # Si se está trabajando en memoria (df proporcionado), retornar el DataFrame
-        if df is not None:
-            return df_actual
-        
-        # Si se está trabajando con archivo, escribir y retornar el DataFrame
-        print(f"Guardando archivo actualizado: {ARCHIVO_PROGRAMAS}")
-        try:
-            escribir_excel_con_reintentos(ARCHIVO_PROGRAMAS, df_actual, sheet_name=HOJA_PROGRAMAS)
-            log_info(f"Archivo actualizado guardado: {ARCHIVO_PROGRAMAS.name}")
-            print("Procesamiento completado exitosamente.")
-        except PermissionError as e:
-            error_msg = explicar_error_archivo_abierto(ARCHIVO_PROGRAMAS, "escribir")
-            log_error(error_msg)
-            raise PermissionError(error_msg) from e
-        return df_actual
-    
-    # Eliminar filas donde CÓDIGO_SNIES_DEL_PROGRAMA está vacío en el histórico
-    df_historico = df_historico.dropna(subset=[COLUMNA_ID])
-    
-    # OPTIMIZACIÓN: Normalizar códigos históricos usando operaciones vectorizadas
-    # Obtener el conjunto de IDs del archivo histórico
-    codigos_hist_str = df_historico[COLUMNA_ID].dropna().astype(str)
-    ids_historicos_raw = codigos_hist_str.str.strip().str.upper().str.replace(r'\.0$', '', regex=True)
-    # Filtrar strings "nan", "none", etc. que pueden aparecer de conversiones
-    ids_historicos = {
-        codigo for codigo in ids_historicos_raw 
-        if codigo and codigo not in ('NAN', 'NONE', 'NULL', '') and not codigo.isspace()
-    }
-    
-    print(f"Total de códigos SNIES en el archivo histórico: {len(ids_historicos)}")
-    if len(ids_historicos) > 0:
-        print(f"Ejemplo de códigos históricos (primeros 5): {list(ids_historicos)[:5]}")
- 
-    # OPTIMIZACIÓN: Usar operación vectorizada en lugar de .apply()
-    # Crear máscara vectorizada para programas nuevos
-    codigos_norm = df_actual['_codigo_normalizado']
-    mask_valido = (
-        codigos_norm.notna() & 
-        (codigos_norm != '') & 
-        ~codigos_norm.isin(['NAN', 'NONE', 'NULL']) &
-        ~codigos_norm.str.isspace()
-    )
-    mask_nuevo = ~codigos_norm.isin(ids_historicos)
-    df_actual[COLUMNA_NUEVO] = (mask_valido & mask_nuevo).map({True: "Sí", False: "No"})
+        log_info(
+            "Códigos SNIES en el histórico: %d (ejemplos: %s)", len(ids_historicos), ejemplos_historicos
+        )
+
+        df_actual[COLUMNA_NUEVO] = np.where(mask_nuevo, "Sí", "No")
 
-    # Eliminar la columna temporal de normalización
-    df_actual = df_actual.drop(columns=['_codigo_normalizado'])
-    
     # Contar programas nuevos
     nuevos = (df_actual[COLUMNA_NUEVO] == "Sí").sum()
     existentes = (df_actual[COLUMNA_NUEVO] == "No").sum()
     total = len(df_actual)
-    print(f"Total de programas procesados: {total}")
-    print(f"Programas nuevos: {nuevos}")
-    print(f"Programas existentes: {existentes}")
+    print(f"Programas procesados: {total} (nuevos: {nuevos}, existentes: {existentes})")
 
     log_resultado(f"Total de programas procesados: {total}")
     log_resultado(f"Nuevos programas detectados: {nuevos}")
     log_resultado(f"Programas existentes: {existentes}")
 
-    # Debug: mostrar algunos ejemplos de códigos nuevos si hay
+    # Detalle para depuración: algunos códigos marcados como nuevos (solo en el log)
     if nuevos > 0:
-        nuevos_codigos = df_actual[df_actual[COLUMNA_NUEVO] == "Sí"][COLUMNA_ID].head(5).tolist()
-        print(f"Ejemplos de códigos marcados como nuevos (primeros 5): {nuevos_codigos}")
+        nuevos_codigos = df_actual[COLUMNA_ID][df_actual[COLUMNA_NUEVO] == "Sí"].head(5).tolist()
+        log_info("Ejemplos de códigos marcados como nuevos (primeros 5): %s", nuevos_codigos)
     
     # Si se está trabajando en memoria (df proporcionado), retornar el DataFrame sin escribir
     if df is not None: